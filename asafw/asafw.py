@@ -5,8 +5,24 @@ import os
 import io
 import shutil
 import gzip
+import mmap
+import struct
+import tarfile
 import tempfile
+import zlib
+import concurrent.futures
+import contextlib
+import fnmatch
+import json
 from Crypto.Hash import MD5, SHA512, SHA256
+import asafw.field1 as field1
+import asafw.gzindex as gzindex
+import asafw.pgzip as pgzip
+import asafw.profiler as profiler
+
+# meta_data_length is a byte counting 16-byte units
+MAX_META_DATA_LENGTH = 0xff << 4
+
 
 class asa_field1(cstruct.CStruct):
     __byte_order__ = cstruct.BIG_ENDIAN
@@ -39,18 +55,9 @@ class asa_field1(cstruct.CStruct):
         return result
 
     def pack(self):
-        data_result = b''
-
-        if isinstance(self.data,list):
-            for list_item in self.data:
-                data_result = bytearray(data_result) + bytearray(list_item.pack())
-        else:
-            data_result = bytearray(data_result) + bytearray(self.data)
-
-        self.length = len(data_result)
-        result = super().pack()
-
-        return bytes(bytearray(result) + bytearray(data_result))
+        result = field1.encode([self], terminator=False)
+        self.length = len(result) - self.size
+        return result
 
 def get_next_field1_header(bin_file):
     return asa_field1(bin_file.read(asa_field1.size))
@@ -58,26 +65,18 @@ def get_next_field1_header(bin_file):
 def get_next_field1_data(bin_file, header):
     return bin_file.read(header.length)   
 
-def parse_field1_headers(bin_file):
-    cur_field = 0
-    headers = []
-    while cur_field < 12:
-        header = get_next_field1_header(bin_file)
-
-        if header.field == 3:
-            header_3 = header
-            header_3.data = []
-            while cur_field < 6:
-                header = get_next_field1_header(bin_file)
-                header.data = get_next_field1_data(bin_file, header)
-                header_3.data.append(header)
-                cur_field = header.field
-            header = header_3
-        else:
-            header.data = get_next_field1_data(bin_file, header)
-        headers.append(header)
-        cur_field = header.field
-
+def parse_field1_headers(bin_file, length=None, schema=field1.MAIN_CONTAINER_SCHEMA):
+    # Only the metadata is read, length defaults to what is left of a BytesIO and to the most a block header can
+    # describe for other files. getvalue() hands back the bytes a BytesIO was made from without copying them.
+    start = bin_file.tell()
+    if isinstance(bin_file, io.BytesIO):
+        view = memoryview(bin_file.getvalue())[start:]
+        if length is not None:
+            view = view[:length]
+    else:
+        view = bin_file.read(MAX_META_DATA_LENGTH if length is None else length)
+    headers, consumed = field1.decode(view, schema)
+    bin_file.seek(start + consumed, os.SEEK_SET)
     return headers
 
 
@@ -99,14 +98,7 @@ def gen_asa_raw_field1_headers(issuer1="CN=CiscoSystems;OU=NCS_Kenton_ASA;O=Cisc
     asa_field1(field=11, data=magic_key),
     asa_field1(field=12, data=b'A')]
 
-    result = bytearray()
-
-    for header in headers:
-        result += bytearray(header.pack())
-    
-    result += bytearray(b'\xeb')
-
-    return bytes(result)
+    return field1.encode(headers)
 
 class asa_block(cstruct.CStruct):
     __byte_order__ = cstruct.LITTLE_ENDIAN
@@ -159,6 +151,82 @@ class asa_block(cstruct.CStruct):
             self.sub_blocks = 0
 
 
+
+class AsaBlockHeader():
+    # Same layout and properties as asa_block, decoded with one precompiled struct call
+    __slots__ = ("block_uuid_raw", "meta_data_length", "unkown1", "data_length", "unkown2", "sub_blocks", "unkown3")
+    layout = struct.Struct("<16sBBI2sB7s")
+    size = layout.size
+
+    def __init__(self, string=None, **kargs):
+        if string is not None:
+            self._set_fields(self.layout.unpack_from(string))
+        else:
+            self._set_fields((bytes(16), 0, 0, 0, bytes(2), 0, bytes(7)))
+        for name, value in kargs.items():
+            setattr(self, name, value)
+
+    def _set_fields(self, fields):
+        (self.block_uuid_raw, self.meta_data_length, self.unkown1, self.data_length,
+            self.unkown2, self.sub_blocks, self.unkown3) = fields
+
+    @classmethod
+    def unpack_from(cls, buffer, offset=0):
+        header = cls.__new__(cls)
+        header._set_fields(cls.layout.unpack_from(buffer, offset))
+        return header
+
+    def pack(self):
+        return self.layout.pack(
+            self.block_uuid_raw, self.meta_data_length, self.unkown1, self.data_length,
+            self.unkown2, self.sub_blocks, self.unkown3)
+
+    def pack_into(self, buffer, offset=0):
+        self.layout.pack_into(
+            buffer, offset,
+            self.block_uuid_raw, self.meta_data_length, self.unkown1, self.data_length,
+            self.unkown2, self.sub_blocks, self.unkown3)
+
+    def __repr__(self):
+        return f"AsaBlockHeader(UUID={self.UUID}, MetaDataLength={hex(self.MetaDataLength)}, " \
+            f"DataLength={hex(self.DataLength)}, HasSubBlocks={self.HasSubBlocks})"
+
+    @property
+    def MetaDataLength(self):
+        return (self.meta_data_length << 4)
+
+    @MetaDataLength.setter
+    def MetaDataLength(self, val):
+        self.meta_data_length = val >> 4
+
+    @property
+    def DataLength(self):
+        return (self.data_length >> 4)
+
+    @DataLength.setter
+    def DataLength(self, val):
+        self.data_length = val << 4
+
+    @property
+    def UUID(self):
+        return uuid.UUID(bytes=bytes(self.block_uuid_raw))
+
+    @UUID.setter
+    def UUID(self, val):
+        if isinstance(val, str):
+            self.block_uuid_raw = uuid.UUID(val).bytes
+        elif isinstance(val, uuid.UUID):
+            self.block_uuid_raw = val.bytes
+
+    @property
+    def HasSubBlocks(self):
+        return self.sub_blocks == 1
+
+    @HasSubBlocks.setter
+    def HasSubBlocks(self, val):
+        self.sub_blocks = 1 if val else 0
+
+
 UUID_ASA_FW_BLOB =          uuid.UUID('11bb8d46-d638-014d-a26b-7d66620dfc74')
 UUID_MAIN_CONTAINER =       uuid.UUID('60d090eb-09f7-1a4a-9f30-9e45f7287490')
 UUID_FW_CONTAINER =         uuid.UUID('71546a9d-ae27-ef42-9798-c3dfbe0dc55e')
@@ -219,13 +287,19 @@ class AsaBlock():
 
     @data.setter
     def data(self, val):
+        self.length_pending = False
         if not self.asa_block_header.HasSubBlocks:
             if val is None:
                 self.asa_block_header.DataLength = 0
             elif isinstance(val, io.IOBase):
-                val.seek(0, io.SEEK_END)
-                self.asa_block_header.DataLength = get_boundary_aligned_length(val.tell())
-                val.seek(0, io.SEEK_SET)
+                if val.seekable():
+                    val.seek(0, io.SEEK_END)
+                    self.asa_block_header.DataLength = get_boundary_aligned_length(val.tell())
+                    val.seek(0, io.SEEK_SET)
+                else:
+                    # Length is unknown until the stream is consumed, write_block back-patches it
+                    self.asa_block_header.DataLength = 0
+                    self.length_pending = True
             elif isinstance(val, bytes):
                 self.asa_block_header.DataLength = get_boundary_aligned_length(len(val))
             elif isinstance(val, str):
@@ -242,29 +316,157 @@ class AsaBlock():
         self._data = val
     
 
+def copy_range(src_fd, dst_fd, src_offset, dst_offset, length):
+    # Let the kernel move the bytes where it can, otherwise fall back to positional reads and writes
+    while length > 0:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, min(length, 0x40000000), src_offset, dst_offset)
+        except (AttributeError, OSError):
+            copied = 0
+        if copied == 0:
+            data = os.pread(src_fd, min(length, COPY_CHUNK_SIZE), src_offset)
+            if not data:
+                raise EOFError(f"Source ended {length} bytes before the end of the copied range")
+            copied = os.pwrite(dst_fd, data, dst_offset)
+        src_offset += copied
+        dst_offset += copied
+        length -= copied
+
+
+def get_file_descriptor(fileobj):
+    # Only plain seekable files can be handed to the kernel, digests, compressors and spools need the bytes
+    if not isinstance(fileobj, (io.FileIO, io.BufferedReader, io.BufferedWriter, io.BufferedRandom)):
+        return None
+    if not fileobj.seekable():
+        return None
+    return fileobj.fileno()
+
+
+def copy_file(src_file, dst_file, length=None):
+    # Copies from the current position of src_file up to length bytes, or to its end, and returns the count
+    src_fd = get_file_descriptor(src_file)
+    dst_fd = get_file_descriptor(dst_file)
+    if src_fd is None or dst_fd is None:
+        copied = 0
+        while length is None or copied < length:
+            data = src_file.read(COPY_CHUNK_SIZE if length is None else min(length - copied, COPY_CHUNK_SIZE))
+            if not data:
+                break
+            dst_file.write(data)
+            copied += len(data)
+        return copied
+
+    src_offset = src_file.tell()
+    dst_offset = dst_file.tell()
+    available = max(os.fstat(src_fd).st_size - src_offset, 0)
+    length = available if length is None else min(length, available)
+    dst_file.flush()
+    copy_range(src_fd, dst_fd, src_offset, dst_offset, length)
+    src_file.seek(src_offset + length, os.SEEK_SET)
+    dst_file.seek(dst_offset + length, os.SEEK_SET)
+    return length
+
+
 def pad_to_boundary(bin_file):
     pos = bin_file.tell()
     new_pos = get_boundary_aligned_length(pos)
     if new_pos > pos:
-        bin_file.write(bytearray(b'\x00') * (new_pos - pos))
+        bin_file.write(bytes(new_pos - pos))
 
-def write_block(bin_file, block):
+def write_block(bin_file, block, manifest=None, _path=()):
+    if manifest is not None and not isinstance(bin_file, DigestingFile):
+        bin_file = DigestingFile(bin_file)
 
-    bin_file.write(block.asa_block_header.pack())
-    if block.asa_block_header.MetaDataLength > 0:
-        bin_file.write(block.meta_data)
-        pad_to_boundary(bin_file)
+    header_offset = bin_file.tell()
+    with profiler.phase("write_header", block.asa_block_header.UUID, AsaBlockHeader.size):
+        bin_file.write(block.asa_block_header.pack())
+        if block.asa_block_header.MetaDataLength > 0:
+            bin_file.write(block.meta_data)
+            pad_to_boundary(bin_file)
 
+    path = _path + (block.asa_block_header.UUID,)
+    data_offset = bin_file.tell()
+    digest = None
+    if manifest is not None:
+        manifest[block_path_key(path)] = None
+        digest = bin_file.begin()
     if not block.asa_block_header.HasSubBlocks:
-        if isinstance(block.data, io.IOBase):
-            shutil.copyfileobj(block.data, bin_file)
-            pad_to_boundary(bin_file)
-        elif isinstance(block.data, bytes):
-            bin_file.write(block.data)
-            pad_to_boundary(bin_file)
+        if isinstance(block.data, (io.IOBase, bytes)):
+            with profiler.phase("copy", block.asa_block_header.UUID) as phase:
+                if isinstance(block.data, io.IOBase):
+                    copy_file(block.data, bin_file)
+                else:
+                    bin_file.write(block.data)
+                phase.add(bin_file.tell() - data_offset)
+            with profiler.phase("pad", block.asa_block_header.UUID):
+                pad_to_boundary(bin_file)
     else:
         for item in block.data:
-            write_block(bin_file, item)
+            if write_block(bin_file, item, manifest, path):
+                block.length_pending = True
+
+    if digest is not None:
+        add_manifest_entry(manifest, path, data_offset, bin_file.end(digest))
+
+    if block.length_pending:
+        patch_block_header(bin_file, header_offset, block.asa_block_header, bin_file.tell() - data_offset)
+    return block.length_pending
+
+
+def patch_block_header(bin_file, header_offset, header, data_length):
+    if not bin_file.seekable():
+        raise ValueError(f"Cannot back-patch the length of block {header.UUID} in a non-seekable output")
+    header.DataLength = data_length
+    end_offset = bin_file.tell()
+    bin_file.seek(header_offset, io.SEEK_SET)
+    bin_file.write(header.pack())
+    bin_file.seek(end_offset, io.SEEK_SET)
+
+
+class GzipStreamWriter():
+    def __init__(self, fileobj, compresslevel=9):
+        self.fileobj = fileobj
+        # Same member layout as gzip.compress(data, mtime=0): zlib writes the header and trailer
+        self._compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data):
+        self._offset += len(data)
+        with profiler.phase("deflate", None, len(data)):
+            self.fileobj.write(self._compressor.compress(data))
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        if self._compressor is not None:
+            with profiler.phase("deflate"):
+                self.fileobj.write(self._compressor.flush())
+            self._compressor = None
+
+
+def compress_boot_block(kernel_block, compress_level=9, compress_jobs=None, boot_block=None):
+    # Compress the kernel container into a temporary file rather than holding it in memory
+    if boot_block is None:
+        boot_block = tempfile.TemporaryFile()
+    if compress_jobs:
+        gzip_writer = pgzip.ParallelGzipWriter(boot_block, compress_level, compress_jobs)
+    else:
+        gzip_writer = GzipStreamWriter(boot_block, compress_level)
+    with gzip_writer as gzip_block:
+        write_block(gzip_block, AsaBlock(asa_block(UUID=UUID_BOOT_FW_ELF_BLOCK), None, kernel_block))
+    boot_block.flush()
+    return boot_block
 
 
 def gen_blocks(
@@ -274,18 +476,15 @@ def gen_blocks(
     fw_meta_data=b'[\x0cu\x0c\x99\x0cw\x0c\x9b\x0c\xba\x0c\xbb\x0c\xae\x0c\xaf\x0c\xc1\x0c\xc2\x0c\xc3\x0c',
     kernel_options='root=/dev/ram quiet loglevel=0 auto kstack=128 reboot=force panic=1 processor.max_cstate=1 useCiscoDma ',
     rootfs_block=None,
-    kernel_block=None):
+    kernel_block=None,
+    compress_level=9,
+    compress_jobs=None,
+    boot_block=None):
 
-    kernel_block_asa =  AsaBlock(
-                                asa_block(UUID=UUID_BOOT_FW_ELF_BLOCK),
-                                meta_data=None,
-                                data=kernel_block
-                            )
+    # An already compressed boot block (see compress_boot_block) is used as is, kernel_block is then ignored
+    if boot_block is None:
+        boot_block = compress_boot_block(kernel_block, compress_level, compress_jobs)
 
-    kernel_block_data = io.BytesIO()
-    write_block(kernel_block_data, kernel_block_asa)
-    kernel_block_data.seek(0, io.SEEK_SET)
-    
     return AsaBlock(
         asa_block(UUID=UUID_MAIN_CONTAINER, HasSubBlocks=True),  
         meta_data=gen_asa_raw_field1_headers(
@@ -306,7 +505,7 @@ def gen_blocks(
                         data=rootfs_block),
                     AsaBlock(asa_block(UUID=UUID_BOOT_FW_BLOCK),
                         meta_data=None,
-                        data=gzip.compress(kernel_block_data.getvalue(), mtime=0)
+                        data=boot_block
                     )
                 ]
             )    
@@ -314,13 +513,36 @@ def gen_blocks(
     )
 
 
-def write_asa(bin_file, top_block):
-    bin_file.write(UUID_ASA_FW_BLOB.bytes)
-    write_block(bin_file, top_block)
+def spool_pending_blocks(block, spools):
+    # Headers are digested as they are written, so a manifest needs every length before the first one goes out
+    if not block.asa_block_header.HasSubBlocks:
+        if not block.length_pending:
+            return False
+        spool = spools.enter_context(tempfile.TemporaryFile())
+        copy_file(block.data, spool)
+        spool.seek(0, io.SEEK_SET)
+        block.data = spool
+        return True
+    if not any([spool_pending_blocks(item, spools) for item in block.data]):
+        return False
+    block.asa_block_header.DataLength = 0
+    block.data = block.data
+    return True
+
+
+def write_asa(bin_file, top_block, manifest=None):
+    with contextlib.ExitStack() as spools:
+        if manifest is not None:
+            spool_pending_blocks(top_block, spools)
+        bin_file.write(UUID_ASA_FW_BLOB.bytes)
+        write_block(bin_file, top_block, manifest)
 
 
 def get_next_block_header(bin_file):
-    return asa_block(bin_file.read(asa_block.size))
+    raw_header = bin_file.read(AsaBlockHeader.size)
+    if len(raw_header) < AsaBlockHeader.size:
+        raise ValueError(f"Truncated block header, got {len(raw_header)} of {AsaBlockHeader.size} bytes")
+    return AsaBlockHeader(raw_header)
 
 def get_next_block_header_meta_data(bin_file, block_header):
     if block_header.MetaDataLength > 0:
@@ -329,93 +551,855 @@ def get_next_block_header_meta_data(bin_file, block_header):
         return None
 
 def parse_block(bin_file):
-    block_header = get_next_block_header(bin_file)
-    block_meta_data = None
-    if block_header.MetaDataLength > 0:
-        block_meta_data = get_next_block_header_meta_data(bin_file, block_header)
-        if block_header.UUID == UUID_MAIN_CONTAINER:
-            meta_data_bin = io.BytesIO(block_meta_data)
-            block_meta_data = parse_field1_headers(meta_data_bin)
+    with profiler.phase("parse_header") as phase:
+        block_header = get_next_block_header(bin_file)
+        phase.label(block_header.UUID, AsaBlockHeader.size + block_header.MetaDataLength)
+        block_meta_data = None
+        if block_header.MetaDataLength > 0:
+            block_meta_data = get_next_block_header_meta_data(bin_file, block_header)
+            if block_header.UUID == UUID_MAIN_CONTAINER:
+                meta_data_bin = io.BytesIO(block_meta_data)
+                block_meta_data = parse_field1_headers(meta_data_bin, block_header.MetaDataLength)
 
     return block_header, block_meta_data
 
 
+class BlockDigest():
+    def __init__(self):
+        self.hashes = {"sha512": SHA512.new(), "sha256": SHA256.new(), "md5": MD5.new()}
+        self.length = 0
+
+    def update(self, data):
+        self.length += len(data)
+        for raw_hash in self.hashes.values():
+            raw_hash.update(data)
+
+    def hexdigests(self):
+        return {name: raw_hash.hexdigest() for name, raw_hash in self.hashes.items()}
+
+
+class DigestingFile():
+    # Feeds every byte read or written through it to the digests of the blocks currently open
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.active = []
+
+    def begin(self):
+        digest = BlockDigest()
+        self.active.append(digest)
+        return digest
+
+    def end(self, digest):
+        self.active.remove(digest)
+        return digest
+
+    def _update(self, data):
+        if self.active:
+            with profiler.phase("hash", None, len(data) * len(self.active)):
+                for digest in self.active:
+                    digest.update(data)
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self._update(data)
+        return data
+
+    def write(self, data):
+        self._update(data)
+        return self.fileobj.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.active and whence == os.SEEK_CUR and offset > 0:
+            # Skipped data still belongs to the open blocks, so read it through
+            while offset > 0:
+                data = self.read(min(offset, COPY_CHUNK_SIZE))
+                if not data:
+                    break
+                offset -= len(data)
+            return self.tell()
+        if self.active:
+            raise ValueError("Cannot seek within blocks that are being digested")
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+
+def block_path_key(path):
+    return "/".join(str(block_uuid) for block_uuid in path)
+
+
+def add_manifest_entry(manifest, path, offset, digest):
+    manifest[block_path_key(path)] = {"offset": offset, "length": digest.length, **digest.hexdigests()}
+
+
+def get_index_manifest(index):
+    manifest = {}
+    for entry in index.walk():
+        digest = BlockDigest()
+        data = entry.data
+        for offset in range(0, len(data), COPY_CHUNK_SIZE):
+            digest.update(data[offset:offset + COPY_CHUNK_SIZE])
+        add_manifest_entry(manifest, entry.path, entry.data_range[0], digest)
+    return manifest
+
+
+def write_manifest(manifest, output_file):
+    json.dump(manifest, output_file, indent=2)
+    output_file.write("\n")
+
+
 def get_hash(bin_file, length):
-    raw_data = bin_file.read(length)
-    raw_hash = SHA512.new(raw_data).digest().hex()
-    bin_file.seek(-length, os.SEEK_CUR)
-    return raw_hash
-
-def try_hash(bin_file):
-    raw_data = bin_file.read()
-
-    for i in range(0, len(raw_data)):
-        raw_hash = SHA512.new(raw_data[i:]).digest().hex()
-        print(f"[{i}:] {raw_hash}")
-        if raw_hash.lower() == "2960fd01b541c4a42bca4a28dc7afbab16b44221defe219acd31d06d99db25e1d8ae1be3a4c2d5bbf337159009b1c4b72e3b424c91f0dbc399a95c0e4ea5239d":
-            exit()
-    
+    raw_hash = SHA512.new()
+    remaining = length
+    with profiler.phase("hash", None, length):
+        while remaining > 0:
+            raw_data = bin_file.read(min(remaining, COPY_CHUNK_SIZE))
+            if not raw_data:
+                break
+            raw_hash.update(raw_data)
+            remaining -= len(raw_data)
+    bin_file.seek(-(length - remaining), os.SEEK_CUR)
+    return raw_hash.digest().hex()
 
 def pprint_tree(node, file=None, _prefix="", _last=True):
-    print(_prefix, "`- " if _last else "|- ", str(node), sep="", file=file)
-    _prefix += "   " if _last else "|  "
-    if hasattr(node, "children"):
-        child_count = len(node.children)
-        for i, child in enumerate(node.children):
-            _last = i == (child_count - 1)
-            pprint_tree(child, file, _prefix, _last)
-
-def get_blocks_from_file(bin_file, output_directory, dump_blocks=False,):
+    stack = [(node, _prefix, _last)]
+    while stack:
+        node, prefix, last = stack.pop()
+        print(prefix, "`- " if last else "|- ", str(node), sep="", file=file)
+        if hasattr(node, "children"):
+            # children builds a new list on every access, so only ask once
+            children = node.children
+            prefix += "   " if last else "|  "
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((children[i], prefix, i == len(children) - 1))
+
+GZIP_MAGIC = b'\x1f\x8b'
+TAR_SPOOL_SIZE = 0x4000000
+COPY_CHUNK_SIZE = 0x100000
+
+class GzipStreamDecoder():
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        pending = True
+        while pending:
+            if self._decompressor is None:
+                # Members may be followed by zero padding up to the block boundary
+                data = bytes(data).lstrip(b'\x00')
+                if not data:
+                    return
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            output = self._decompressor.decompress(data, COPY_CHUNK_SIZE)
+            if output:
+                yield output
+
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                self._decompressor = None
+                pending = len(data) > 0
+            else:
+                data = self._decompressor.unconsumed_tail
+                pending = len(data) > 0 or len(output) == COPY_CHUNK_SIZE
+
+    def flush(self):
+        if self._decompressor is not None:
+            raise EOFError("Compressed block ended before the end-of-stream marker was reached")
+
+
+class DirectoryDumpTarget():
+    def makedirs(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def open(self, path, size=None):
+        return open(path, "wb")
+
+
+class TarDumpTarget():
+    """Writes the extracted tree as a tar stream instead of files under the output directory.
+
+    A member whose size is known up front is streamed straight into the archive. Anything else,
+    and anything opened while another member is being streamed, goes through a spool and is
+    appended once the archive is free.
+    """
+
+    def __init__(self, fileobj, root, mtime=0):
+        self.fileobj = fileobj
+        self.root = root
+        self.mtime = int(mtime)
+        self.directories = set()
+        self.streaming = None
+        self.queue = []
+
+    def _get_tarinfo(self, path, size=0, directory=False):
+        tarinfo = tarfile.TarInfo(os.path.relpath(path, self.root))
+        tarinfo.mtime = self.mtime
+        if directory:
+            tarinfo.type = tarfile.DIRTYPE
+            tarinfo.mode = 0o755
+        else:
+            tarinfo.size = size
+            tarinfo.mode = 0o644
+        return tarinfo
+
+    def _write_header(self, tarinfo):
+        self.fileobj.write(tarinfo.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+
+    def _pad(self, size):
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            self.fileobj.write(bytes(padding))
+
+    def _flush_queue(self):
+        while self.streaming is None and self.queue:
+            path, spool = self.queue.pop(0)
+            if spool is None:
+                self._write_header(self._get_tarinfo(path, directory=True))
+                continue
+            size = spool.tell()
+            spool.seek(0, os.SEEK_SET)
+            self._write_header(self._get_tarinfo(path, size))
+            shutil.copyfileobj(spool, self.fileobj, COPY_CHUNK_SIZE)
+            self._pad(size)
+            spool.close()
+
+    def makedirs(self, path):
+        missing = []
+        while os.path.relpath(path, self.root) != "." and path not in self.directories:
+            self.directories.add(path)
+            missing.append(path)
+            path = os.path.dirname(path)
+        for directory in reversed(missing):
+            self.queue.append((directory, None))
+        self._flush_queue()
+
+    def open(self, path, size=None):
+        if size is not None and self.streaming is None and not self.queue:
+            self._write_header(self._get_tarinfo(path, size))
+            self.streaming = _TarMemberWriter(self, path, size)
+            return self.streaming
+        return _TarMemberWriter(self, path)
+
+    def finish_member(self, member):
+        if member.spool is None:
+            if member.written != member.size:
+                raise ValueError(f"{member.path} is {hex(member.written)} bytes, its header says {hex(member.size)}")
+            self._pad(member.size)
+            self.streaming = None
+        else:
+            self.queue.append((member.path, member.spool))
+        self._flush_queue()
+
+    def abort_member(self, member):
+        # The archive is abandoned along with the extract, so the member is neither checked nor padded
+        if member is self.streaming:
+            self.streaming = None
+        if member.spool is not None:
+            member.spool.close()
+
+    def close(self):
+        self._flush_queue()
+        if self.streaming is not None or self.queue:
+            raise ValueError("Tar stream closed while a member is still open")
+        self.fileobj.write(bytes(tarfile.BLOCKSIZE * 2))
+
+
+class _TarMemberWriter():
+    def __init__(self, target, path, size=None):
+        self.target = target
+        self.path = path
+        self.size = size
+        self.written = 0
+        self.spool = None
+        if size is None:
+            self.spool = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_SIZE)
+        self.closed = False
+
+    def write(self, data):
+        self.written += len(data)
+        if self.spool is None:
+            return self.target.fileobj.write(data)
+        return self.spool.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.target.finish_member(self)
+
+    def abort(self):
+        if not self.closed:
+            self.closed = True
+            self.target.abort_member(self)
+
+
+class BlockDumper():
+    def __init__(self, output_directory, header, target=None):
+        self.header = header
+        self.target = DirectoryDumpTarget() if target is None else target
+        self.output_dir = os.path.join(output_directory, str(header.UUID))
+        self.target.makedirs(self.output_dir)
+        self.output_path = os.path.join(self.output_dir, "block")
+        self.block_file = self.target.open(self.output_path, header.DataLength)
+        self.bin_file = None
+        self.decoder = None
+        self.nested = None
+        self.started = False
+
+    def write(self, chunk):
+        with profiler.phase("write_block", self.header.UUID, len(chunk)):
+            self.block_file.write(chunk)
+        if not self.started:
+            self.started = True
+            if bytes(chunk[:len(GZIP_MAGIC)]) == GZIP_MAGIC:
+                self.decoder = GzipStreamDecoder()
+                self.bin_file = self.target.open(f"{self.output_path}.bin")
+                if self.header.UUID == UUID_BOOT_FW_BLOCK:
+                    self.nested = NestedBlockDumper(self.output_dir, self.target)
+
+        if self.decoder is not None:
+            with profiler.phase("inflate", self.header.UUID) as phase:
+                for output in self.decoder.decompress(chunk):
+                    phase.add(len(output))
+                    self.bin_file.write(output)
+                    if self.nested is not None:
+                        self.nested.write(output)
+
+    def copy_from(self, bin_file, length):
+        # Payloads that are not gzip are only stored, so between plain files the kernel can copy them
+        src_fd = get_file_descriptor(bin_file)
+        if self.started or src_fd is None or get_file_descriptor(self.block_file) is None:
+            return 0
+        if os.pread(src_fd, len(GZIP_MAGIC), bin_file.tell()) == GZIP_MAGIC:
+            return 0
+        self.started = True
+        with profiler.phase("copy", self.header.UUID) as phase:
+            copied = copy_file(bin_file, self.block_file, length)
+            phase.add(copied)
+        return copied
+
+    def close(self):
+        try:
+            data = f"DATA BLOCK [{hex(self.header.DataLength)}] {self.output_path}"
+            if self.decoder is not None:
+                self.decoder.flush()
+                data += ",block.bin"
+                if self.nested is not None:
+                    data = [self.nested.close()]
+                    self.header.HasSubBlocks = True
+        except BaseException:
+            self.close_files(abort=True)
+            raise
+        self.close_files()
+        return data
+
+    def close_files(self, abort=False):
+        # On an error the files are only closed, so a short tar member does not hide the exception behind its own
+        output_files = [self.block_file, self.bin_file]
+        if abort and self.nested is not None and self.nested.dumper is not None:
+            output_files += [self.nested.dumper.block_file, self.nested.dumper.bin_file]
+        for output_file in output_files:
+            if output_file is None:
+                continue
+            if abort and isinstance(output_file, _TarMemberWriter):
+                output_file.abort()
+            else:
+                output_file.close()
+
+
+class NestedBlockDumper():
+    def __init__(self, output_directory, target=None):
+        self.output_directory = output_directory
+        self.target = target
+        self.pending = bytearray()
+        self.header = None
+        self.meta_data = None
+        self.dumper = None
+        self.remaining = 0
+
+    def write(self, chunk):
+        if self.pending is not None:
+            self.pending += chunk
+            if self.header is None:
+                if len(self.pending) < AsaBlockHeader.size:
+                    return
+                self.header = AsaBlockHeader.unpack_from(self.pending)
+            data_offset = AsaBlockHeader.size + self.header.MetaDataLength
+            if len(self.pending) < data_offset:
+                return
+            if self.header.MetaDataLength > 0:
+                self.meta_data = bytes(self.pending[AsaBlockHeader.size:data_offset])
+            if self.header.DataLength > 0:
+                self.dumper = BlockDumper(self.output_directory, self.header, self.target)
+                self.remaining = self.header.DataLength
+            chunk = bytes(self.pending[data_offset:])
+            self.pending = None
+
+        # Anything after the first block is ignored, as the boot payload only holds one
+        if self.remaining > 0 and chunk:
+            chunk = chunk[:self.remaining]
+            self.dumper.write(chunk)
+            self.remaining -= len(chunk)
+
+    def close(self):
+        if self.pending is not None:
+            raise ValueError("Nested block ended before its header was complete")
+        data = None
+        if self.dumper is not None:
+            data = self.dumper.close()
+        return AsaBlock(self.header, self.meta_data, data)
+
+
+def describe_dumped_block(header, output_directory, source_directory=None):
+    # Rebuilds what dump_block returns from the files it left behind
+    source_directory = output_directory if source_directory is None else source_directory
+    output_dir = os.path.join(output_directory, str(header.UUID))
+    output_path = os.path.join(output_dir, "block")
+    source_path = os.path.join(source_directory, str(header.UUID), "block")
+    data = f"DATA BLOCK [{hex(header.DataLength)}] {output_path}"
+    if os.path.exists(f"{source_path}.bin"):
+        data += ",block.bin"
+        if header.UUID == UUID_BOOT_FW_BLOCK:
+            with open(f"{source_path}.bin", "rb") as sub_bin:
+                nested_header = get_next_block_header(sub_bin)
+                nested_meta_data = get_next_block_header_meta_data(sub_bin, nested_header)
+            nested_data = None
+            if nested_header.DataLength > 0:
+                nested_data = describe_dumped_block(
+                    nested_header, output_dir, os.path.join(source_directory, str(header.UUID)))
+            header.HasSubBlocks = True
+            data = [AsaBlock(nested_header, nested_meta_data, nested_data)]
+    return data
+
+
+def dump_block(bin_file, header, output_directory, cache=None, target=None):
+    if cache is not None:
+        return cache.dump_block(bin_file, header, output_directory)
+
+    dumper = BlockDumper(output_directory, header, target)
+    try:
+        remaining = header.DataLength - dumper.copy_from(bin_file, header.DataLength)
+        while remaining > 0:
+            with profiler.phase("read", header.UUID) as phase:
+                chunk = bin_file.read(min(remaining, COPY_CHUNK_SIZE))
+                phase.add(len(chunk))
+            if not chunk:
+                break
+            dumper.write(chunk)
+            remaining -= len(chunk)
+    except BaseException:
+        dumper.close_files(abort=True)
+        raise
+    return dumper.close()
+
+def match_block_path(path, patterns):
+    # A pattern is a glob over one block UUID or over the whole UUID path, and a container it selects
+    # brings its children along
+    if patterns is None:
+        return True
+    patterns = [pattern.strip("/").lower() for pattern in patterns]
+    for depth in range(1, len(path) + 1):
+        key = block_path_key(path[:depth])
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(str(path[depth - 1]), pattern) or fnmatch.fnmatchcase(key, pattern):
+                return True
+    return False
+
+
+def is_block_selected(path, only):
+    # The ELF block only shows up once the boot block is inflated, so asking for it selects the boot block
+    if path[-1] == UUID_BOOT_FW_BLOCK:
+        path += (UUID_BOOT_FW_ELF_BLOCK,)
+    return match_block_path(path, only)
+
+
+def get_blocks_from_file(bin_file, output_directory, dump_blocks=False, manifest=None, cache=None, target=None, only=None, _path=()):
+    if manifest is not None and not isinstance(bin_file, DigestingFile):
+        bin_file = DigestingFile(bin_file)
+
     header, header_metadata_headers = parse_block(bin_file)
+    path = _path + (header.UUID,)
     starting_offset = bin_file.tell()
     current_size = bin_file.tell() - starting_offset
+    digest = None
+    if manifest is not None:
+        # Reserve the key so the manifest lists blocks in file order
+        manifest[block_path_key(path)] = None
+        digest = bin_file.begin()
     data = None
     if header.HasSubBlocks:
         data = []
         while current_size < header.DataLength:
             output_dir = os.path.join(output_directory, str(header.UUID))
-            data.append(get_blocks_from_file(bin_file, output_dir, dump_blocks))
+            data.append(get_blocks_from_file(bin_file, output_dir, dump_blocks, manifest, cache, target, only, path))
             current_size = bin_file.tell() - starting_offset
     else:
         if header.DataLength > 0:
             data = f"DATA BLOCK [{hex(header.DataLength)}]"
-            if dump_blocks:
-                output_dir = os.path.join(output_directory, str(header.UUID))
-                if not os.path.isdir(output_dir):
-                    os.makedirs(output_dir, exist_ok=True)
-                output_path = os.path.join(output_dir, "block")
-                data += " " + f"{output_path}"
-                with open(f"{output_path}", "wb") as output_block_bin:
-                    output_block_bin.write(bin_file.read(header.DataLength))
-                try:
-                    with gzip.open(f"{output_path}", 'rb') as f_in:
-                        with open(f"{output_path}.bin", 'wb') as f_out:
-                            shutil.copyfileobj(f_in, f_out)
-                            data += ",block.bin"
-                    if header.UUID == UUID_BOOT_FW_BLOCK:
-                        with open(f"{output_path}.bin", 'rb') as sub_bin:
-                            data = [get_blocks_from_file(sub_bin, output_dir, dump_blocks)]
-                            header.HasSubBlocks = True
-                except Exception as e:
-                    pass
+            if dump_blocks and is_block_selected(path, only):
+                data = dump_block(bin_file, header, output_directory, cache, target)
             else:
 
                 #data +=  f"sum: f{raw_hash.digest()}"
                 bin_file.seek(header.DataLength, os.SEEK_CUR)
-    
+
+    if digest is not None:
+        add_manifest_entry(manifest, path, starting_offset, bin_file.end(digest))
+
     return AsaBlock(header, header_metadata_headers, data)
 
+class BlockFrame():
+    __slots__ = ("path", "data_end")
+
+    def __init__(self, path, data_end):
+        self.path = path
+        self.data_end = data_end
+
+
+def walk_block_headers(read_header, offset, file_size):
+    # Pre-order over the block tree with an explicit stack, so nesting depth is not bound by recursion
+    stack = []
+    while True:
+        while stack and offset >= stack[-1].data_end:
+            stack.pop()
+            if not stack:
+                return
+
+        header = read_header(offset)
+        path = (stack[-1].path if stack else ()) + (header.UUID,)
+        meta_start = offset + AsaBlockHeader.size
+        data_start = meta_start + header.MetaDataLength
+        data_end = data_start + header.DataLength
+        if data_end > file_size:
+            raise ValueError(f"Block {header.UUID} at {hex(offset)} extends past end of file")
+
+        yield len(stack), path, header, (meta_start, data_start), (data_start, data_end)
+        if header.HasSubBlocks and data_end > data_start:
+            stack.append(BlockFrame(path, data_end))
+            offset = data_start
+        elif stack:
+            offset = data_end
+        else:
+            return
+
+
+def iter_blocks(bin_file):
+    """Yields (depth, path, header, meta_range, data_range) for every block, reading only the headers."""
+    bin_file.seek(0, os.SEEK_END)
+    file_size = bin_file.tell()
+    bin_file.seek(0, os.SEEK_SET)
+    offset = 0x10 if bin_file.read(0x10) == UUID_ASA_FW_BLOB.bytes else 0
+
+    def read_header(header_offset):
+        bin_file.seek(header_offset, os.SEEK_SET)
+        raw_header = bin_file.read(AsaBlockHeader.size)
+        if len(raw_header) < AsaBlockHeader.size:
+            raise ValueError(f"Truncated block header at {hex(header_offset)}")
+        return AsaBlockHeader.unpack_from(raw_header)
+
+    yield from walk_block_headers(read_header, offset, file_size)
+
+
+class AsaBlockEntry():
+    def __init__(self, index, header, path, header_offset, meta_range, data_range):
+        self.index = index
+        self.header = header
+        self.path = path
+        self.header_offset = header_offset
+        self.meta_range = meta_range
+        self.data_range = data_range
+        self.children = []
+
+    def __str__(self):
+        return f"[{self.header.UUID}]"
+
+    @property
+    def UUID(self):
+        return self.header.UUID
+
+    @property
+    def meta_data(self):
+        return self.index.view[self.meta_range[0]:self.meta_range[1]]
+
+    @property
+    def data(self):
+        return self.index.view[self.data_range[0]:self.data_range[1]]
+
+    def walk(self):
+        stack = [self]
+        while stack:
+            entry = stack.pop()
+            yield entry
+            stack.extend(reversed(entry.children))
+
+
+class AsaBlockIndex():
+    def __init__(self, bin_file):
+        self._mmap = None
+        if isinstance(bin_file, io.BytesIO):
+            self.view = bin_file.getbuffer()
+        else:
+            self._mmap = mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self._mmap)
+
+        self.offset = 0
+        if bytes(self.view[0:0x10]) == UUID_ASA_FW_BLOB.bytes:
+            self.offset = 0x10
+        try:
+            self.root = self._index_blocks()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.view)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _read_header(self, offset):
+        if offset + AsaBlockHeader.size > len(self.view):
+            raise ValueError(f"Truncated block header at {hex(offset)}")
+        return AsaBlockHeader.unpack_from(self.view, offset)
+
+    def _index_blocks(self):
+        parents = []
+        for depth, path, header, meta_range, data_range in walk_block_headers(self._read_header, self.offset, len(self.view)):
+            entry = AsaBlockEntry(self, header, path, meta_range[0] - AsaBlockHeader.size, meta_range, data_range)
+            del parents[depth:]
+            if parents:
+                parents[-1].children.append(entry)
+            parents.append(entry)
+        return parents[0]
+
+    def walk(self):
+        return self.root.walk()
+
+    def find(self, block_uuid):
+        return [entry for entry in self.walk() if entry.UUID == block_uuid]
+
+
+def get_blocks_from_index(entry, leaves=None):
+    # AsaBlock adjusts header lengths as it is built, so keep the index's copy intact
+    header = AsaBlockHeader(entry.header.pack())
+    meta_data = None
+    if header.MetaDataLength > 0:
+        meta_data = bytes(entry.meta_data)
+        if header.UUID == UUID_MAIN_CONTAINER:
+            meta_data = parse_field1_headers(io.BytesIO(meta_data))
+
+    data = None
+    if header.HasSubBlocks:
+        data = [get_blocks_from_index(child, leaves) for child in entry.children]
+    elif header.DataLength > 0:
+        data = f"DATA BLOCK [{hex(header.DataLength)}]"
+
+    block = AsaBlock(header, meta_data, data)
+    if leaves is not None and data is not None and not header.HasSubBlocks:
+        leaves.append((entry, block))
+    return block
+
+
+def _dump_block_at(file_name, offset, raw_header, output_directory, cache, profile=False):
+    header = AsaBlockHeader(raw_header)
+    # The phases of a worker process are sent back with its result, so the parent's profile covers them too
+    with profiler.profiling() if profile else contextlib.nullcontext() as session:
+        with open(file_name, "rb") as bin_file:
+            bin_file.seek(offset, os.SEEK_SET)
+            data = dump_block(bin_file, header, output_directory, cache)
+    events = None
+    if session is not None:
+        events = (session.origin, [event._replace(thread=os.getpid()) for event in session.events])
+    return data, header.HasSubBlocks, events
+
+
+def get_blocks_from_file_parallel(file_name, output_directory, jobs, manifest=None, cache=None, only=None):
+    leaves = []
+    with open(file_name, "rb") as bin_file, AsaBlockIndex(bin_file) as index, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        top_block = get_blocks_from_index(index.root, leaves)
+        leaves = [leaf for leaf in leaves if is_block_selected(leaf[0].path, only)]
+
+        # Start the largest payloads first so they do not end up trailing the pool
+        leaves.sort(key=lambda leaf: leaf[0].header.DataLength, reverse=True)
+        futures = [
+            executor.submit(
+                _dump_block_at,
+                file_name,
+                entry.data_range[0],
+                entry.header.pack(),
+                os.path.join(output_directory, *[str(block_uuid) for block_uuid in entry.path[:-1]]),
+                cache,
+                profiler.is_enabled()
+            )
+            for entry, _ in leaves
+        ]
+        # Digest from the mapping while the workers extract, the pages are shared through the page cache
+        if manifest is not None:
+            manifest.update(get_index_manifest(index))
+
+        for (_, block), future in zip(leaves, futures):
+            data, has_sub_blocks, events = future.result()
+            if events is not None:
+                profiler.merge(*events)
+            block.asa_block_header.HasSubBlocks = has_sub_blocks
+            block.data = data
+
+    return top_block
+
+def find_field1(headers, field):
+    for header in headers:
+        if header.field == field:
+            return header
+        if isinstance(header.data, list):
+            child = find_field1(header.data, field)
+            if child is not None:
+                return child
+    return None
+
+
+def get_image_info(file_name):
+    info = {"path": file_name, "size": os.path.getsize(file_name)}
+    with open(file_name, "rb") as bin_file:
+        with AsaBlockIndex(bin_file) as index:
+            if index.root.UUID == UUID_MAIN_CONTAINER and index.root.header.MetaDataLength > 0:
+                headers = parse_field1_headers(io.BytesIO(bytes(index.root.meta_data)))
+                for name, field in (("issuer", 4), ("serial", 5), ("issuer2", 6)):
+                    header = find_field1(headers, field)
+                    if header is not None:
+                        info[name] = bytes(header.data).decode("ascii", "replace")
+
+            for entry in index.find(UUID_KERNEL_PARAMS):
+                info["kernel_options"] = bytes(entry.meta_data).rstrip(b"\x00").decode("ascii", "replace")
+
+            info["blocks"] = [
+                {
+                    "path": block_path_key(entry.path),
+                    "offset": entry.header_offset,
+                    "meta_data_length": entry.header.MetaDataLength,
+                    "data_length": entry.header.DataLength,
+                }
+                for entry in index.walk()
+            ]
+    return info
+
+
+def _get_image_info_or_error(file_name):
+    try:
+        return get_image_info(file_name)
+    except Exception as e:
+        return {"path": file_name, "error": str(e)}
+
+
+def iter_image_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def get_images_info(paths, jobs=8):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_get_image_info_or_error, iter_image_files(paths))
+
+
+ELF_MAGIC = b'\x7fELF'
+ELF_HEADER_SIZE = 0x40
+
+
+def parse_elf_header(data):
+    if len(data) < 0x20 or data[:4] != ELF_MAGIC:
+        return None
+    elf_class = 64 if data[4] == 2 else 32
+    byte_order = ">" if data[5] == 2 else "<"
+    entry_format = "Q" if elf_class == 64 else "I"
+    elf_type, machine, version, entry = struct.unpack_from(f"{byte_order}HHI{entry_format}", data, 0x10)
+    return {
+        "class": elf_class,
+        "byte_order": "big" if byte_order == ">" else "little",
+        "type": elf_type,
+        "machine": machine,
+        "version": version,
+        "entry": hex(entry),
+    }
+
+
+def find_boot_block(index):
+    entries = index.find(UUID_BOOT_FW_BLOCK)
+    if not entries:
+        raise ValueError("Image has no boot block")
+    return entries[0]
+
+
+def get_boot_info(file_name):
+    with open(file_name, "rb") as bin_file, AsaBlockIndex(bin_file) as index:
+        entry = find_boot_block(index)
+        # Only the windows that are read get inflated, not the whole kernel
+        boot_block = gzindex.GzipIndex(entry.data)
+        try:
+            header = AsaBlockHeader.unpack_from(boot_block.read(0, AsaBlockHeader.size))
+            data_offset = AsaBlockHeader.size + header.MetaDataLength
+            info = {
+                "path": file_name,
+                "offset": entry.data_range[0],
+                "length": entry.header.DataLength,
+                "uuid": str(header.UUID),
+                "meta_data_length": header.MetaDataLength,
+                "data_offset": data_offset,
+                "data_length": header.DataLength,
+            }
+            elf = parse_elf_header(boot_block.read(data_offset, ELF_HEADER_SIZE))
+            if elf is not None:
+                info["elf"] = elf
+        finally:
+            # The access points hold slices of the mapping, drop them before it is closed
+            del boot_block
+    return info
+
+
+def read_boot_block(file_name, offset, length):
+    with open(file_name, "rb") as bin_file, AsaBlockIndex(bin_file) as index:
+        boot_block = gzindex.GzipIndex(find_boot_block(index).data)
+        try:
+            return boot_block.read(offset, length)
+        finally:
+            del boot_block
+
+
 def check_for_asa_fw_blob(bin_file):
     first_uuid = bin_file.read(0x10)
     if uuid.UUID(bytes=first_uuid) != UUID_ASA_FW_BLOB:
         bin_file.seek(0, os.SEEK_SET)
 
-def create_boot_block(output_block, input_block):
+def create_boot_block(output_block, input_block, compress_level=9, compress_jobs=None):
     # with gzip.open(output_file, 'wb') as gzip_block:
     #     write_block(gzip_block, AsaBlock(asa_block(UUID=UUID_BOOT_FW_ELF_BLOCK), None, input_block))
     #     gzip_block.fileobj = ''
 
-    with gzip.GzipFile('', 'wb', 9, output_block) as gzip_block:
+    if compress_jobs:
+        gzip_writer = pgzip.ParallelGzipWriter(output_block, compress_level, compress_jobs)
+    else:
+        gzip_writer = gzip.GzipFile('', 'wb', compress_level, output_block)
+    with gzip_writer as gzip_block:
         write_block(gzip_block, AsaBlock(asa_block(UUID=UUID_BOOT_FW_ELF_BLOCK), None, input_block))
 
         
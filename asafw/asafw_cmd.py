@@ -1,7 +1,21 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import json
+import os
 import asafw.asafw as asafw
+import asafw.batch as batch
+import asafw.cache as cache
+import asafw.carve as carve
+import asafw.delta as delta
+import asafw.hashsearch as hashsearch
+import asafw.patch as patch
+import asafw.profiler as profiler
+import asafw.rootfs as rootfs
+import asafw.signature as signature
+import asafw.util as util
+import asafw.verify as verify
 import sys
 
 
@@ -26,8 +40,18 @@ F5:AA:1D:03:BD:A1:C3:9F:97:80:E6:63:05:27:F2:1F
 """
 
 
+def write_profile(session, summary, trace_file):
+    if summary:
+        session.write_summary(sys.stderr)
+    if trace_file:
+        with open(trace_file, 'w') as output_file:
+            session.write_chrome_trace(output_file)
+
+
 def main():
     parser = argparse.ArgumentParser(description="ASA Firmware tool")
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in each phase per block to stderr')
+    parser.add_argument('--profile-trace', type=str, help='Write the phases as Chrome trace-event JSON to this file')
 
     subparser = parser.add_subparsers(required=True)
 
@@ -36,7 +60,91 @@ def main():
     extract_parser.add_argument('file', type=str, help="File to extract")
     extract_parser.add_argument('--output-dir', type=str, default='/tmp', help="Directory to extract blocks to")
     extract_parser.add_argument('--display-only',action='store_true', help='Only display blocks (do not extract)')
+    extract_parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes used to extract leaf blocks')
+    extract_parser.add_argument('--manifest', type=str, help='Write SHA512/SHA256/MD5 digests of every block to this JSON file')
+    extract_parser.add_argument('--cache-dir', type=str, help='Share extracted blocks through a content-addressed cache in this directory')
+    extract_parser.add_argument('--cache-max-size', type=util.parse_size, help='Evict least recently used cache entries above this size, e.g. 20G')
+    extract_parser.add_argument('--format', type=str, default='dir', choices=('dir', 'tar'), help='Write the blocks as files under --output-dir or as a tar stream')
+    extract_parser.add_argument('--only', type=str, action='append', help='Only dump blocks under this UUID or UUID path glob, e.g. */1a4dbf47-*; repeatable')
+    extract_parser.add_argument('-o', '--output', type=str, default='-', help='Tar file to write, - for stdout (with --format tar)')
     
+    info_parser = subparser.add_parser('info')
+    info_parser.set_defaults(command='info')
+    info_parser.add_argument('paths', type=str, nargs='+', help='Image files or directories to scan')
+    info_parser.add_argument('--jobs', type=int, default=8, help='Number of images parsed concurrently')
+
+    boot_info_parser = subparser.add_parser('boot-info')
+    boot_info_parser.set_defaults(command='boot-info')
+    boot_info_parser.add_argument('file', type=str, help='Image to inspect')
+
+    boot_read_parser = subparser.add_parser('boot-read')
+    boot_read_parser.set_defaults(command='boot-read')
+    boot_read_parser.add_argument('file', type=str, help='Image to read from')
+    boot_read_parser.add_argument('--offset', type=lambda value: int(value, 0), default=0, help='Offset into the inflated boot block')
+    boot_read_parser.add_argument('--length', type=lambda value: int(value, 0), required=True, help='Number of bytes to write to stdout')
+
+    ls_rootfs_parser = subparser.add_parser('ls-rootfs')
+    ls_rootfs_parser.set_defaults(command='ls-rootfs')
+    ls_rootfs_parser.add_argument('file', type=str, help='Image to list')
+    ls_rootfs_parser.add_argument('patterns', type=str, nargs='*', help='Only list paths matching these globs')
+
+    cat_rootfs_parser = subparser.add_parser('cat-rootfs')
+    cat_rootfs_parser.set_defaults(command='cat-rootfs')
+    cat_rootfs_parser.add_argument('file', type=str, help='Image to read from')
+    cat_rootfs_parser.add_argument('patterns', type=str, nargs='+', help='Paths or globs of the members to read')
+    cat_rootfs_parser.add_argument('--output-dir', type=str, help='Extract the matching members here instead of writing them to stdout')
+
+    verify_parser = subparser.add_parser('verify')
+    verify_parser.set_defaults(command='verify')
+    verify_parser.add_argument('paths', type=str, nargs='+', help='Image files or directories to check')
+    verify_parser.add_argument('--jobs', type=int, default=8, help='Number of images checked concurrently')
+    verify_parser.add_argument('--strict', action='store_true', help='Fail on warnings such as unknown block UUIDs too')
+
+    signature_parser = subparser.add_parser('verify-signature')
+    signature_parser.set_defaults(command='verify-signature')
+    signature_parser.add_argument('paths', type=str, nargs='+', help='Image files or directories to check')
+    signature_parser.add_argument('--offset', type=lambda value: int(value, 0), help='Start of the signed region (default: main container data)')
+    signature_parser.add_argument('--length', type=lambda value: int(value, 0), help='Length of the signed region')
+    signature_parser.add_argument('--jobs', type=int, default=8, help='Number of images checked concurrently')
+    signature_parser.add_argument('--cache', type=str, default=signature.get_default_cache_path(), help='File the results are cached in')
+    signature_parser.add_argument('--no-cache', action='store_true', help='Always hash the images')
+
+    carve_parser = subparser.add_parser('carve')
+    carve_parser.set_defaults(command='carve')
+    carve_parser.add_argument('file', type=str, help='Raw dump to search for images')
+    carve_parser.add_argument('--output-dir', type=str, help='Copy every valid image found here')
+    carve_parser.add_argument('--jobs', type=int, help='Number of worker processes scanning the dump (default: one per CPU)')
+    carve_parser.add_argument('--all', action='store_true', help='Also report signatures that do not start a valid image')
+
+    patch_parser = subparser.add_parser('patch')
+    patch_parser.set_defaults(command='patch')
+    patch_parser.add_argument('file', type=str, help='Image to patch')
+    patch_parser.add_argument('--kernel-options', type=str, help='Replace the kernel args')
+    patch_parser.add_argument('--rootfs', type=str, help='Replace the rootfs with this file')
+    patch_parser.add_argument('--output', type=str, help='Write the patched image here instead of modifying the input')
+
+    diff_parser = subparser.add_parser('diff')
+    diff_parser.set_defaults(command='diff')
+    diff_parser.add_argument('old', type=str, help='Image the delta applies to')
+    diff_parser.add_argument('new', type=str, help='Image the delta rebuilds')
+    diff_parser.add_argument('--output', type=str, required=True, help='Delta file')
+
+    apply_parser = subparser.add_parser('apply')
+    apply_parser.set_defaults(command='apply')
+    apply_parser.add_argument('old', type=str, help='Image the delta was made against')
+    apply_parser.add_argument('delta', type=str, help='Delta file from diff')
+    apply_parser.add_argument('--output', type=str, required=True, help='Rebuilt image')
+
+    search_hash_parser = subparser.add_parser('search-hash')
+    search_hash_parser.set_defaults(command='search-hash')
+    search_hash_parser.add_argument('file', type=str, help='File to search')
+    search_hash_parser.add_argument('--digest', type=str, action='append', required=True, help='Hex digest to look for (repeatable)')
+    search_hash_parser.add_argument('--algorithm', type=str, action='append', choices=sorted(hashsearch.ALGORITHMS), help='Hash algorithm to try (repeatable, default from digest length)')
+    search_hash_parser.add_argument('--jobs', type=int, help='Number of worker processes (default: all cores)')
+    search_hash_parser.add_argument('--start-range', type=str, help='Only try start offsets in START:END')
+    search_hash_parser.add_argument('--structural-only', action='store_true', help='Only try ranges between block boundaries')
+    search_hash_parser.add_argument('--all', action='store_true', help='Keep searching after every digest has been found')
+
     create_parser = subparser.add_parser('create')
     create_parser.set_defaults(command='create')
 
@@ -46,6 +154,8 @@ def main():
     create_boot_parser.set_defaults(create_command='boot')
     create_boot_parser.add_argument('file', type=str, help='Input boot binary to package')
     create_boot_parser.add_argument('--output', type=str, help='Output file')
+    create_boot_parser.add_argument('--compress-level', type=int, default=9, choices=range(1, 10), metavar='{1-9}', help='gzip compression level')
+    create_boot_parser.add_argument('--compress-jobs', type=int, help='Compress independent chunks on this many threads (reproducible for a given level)')
 
     create_fw_parser = create_subparser.add_parser('fw')
     create_fw_parser.set_defaults(create_command='fw')
@@ -53,21 +163,155 @@ def main():
     create_fw_parser.add_argument('--kernel-options', type=str, help='Kernel args')
     create_fw_parser.add_argument('--rootfs', type=str, help='Input rootfs')
     create_fw_parser.add_argument('--output', type=str, help='Output file')
+    create_fw_parser.add_argument('--compress-level', type=int, default=9, choices=range(1, 10), metavar='{1-9}', help='gzip compression level for the boot block')
+    create_fw_parser.add_argument('--compress-jobs', type=int, help='Compress the boot block on this many threads (reproducible for a given level)')
+    create_fw_parser.add_argument('--manifest', type=str, help='Write SHA512/SHA256/MD5 digests of every block to this JSON file')
+
+    create_batch_parser = create_subparser.add_parser('fw-batch')
+    create_batch_parser.set_defaults(create_command='fw-batch')
+    create_batch_parser.add_argument('variants', type=str, help='CSV or JSON list of variants with output, serial, magic_key (hex) and kernel_options')
+    create_batch_parser.add_argument('--format', type=str, choices=('csv', 'json'), help='Format of the variants file (default: from its extension)')
+    create_batch_parser.add_argument('--kernel', type=str, required=True, help='Input kernel')
+    create_batch_parser.add_argument('--rootfs', type=str, required=True, help='Input rootfs')
+    create_batch_parser.add_argument('--output-dir', type=str, default='.', help='Directory relative outputs are written to')
+    create_batch_parser.add_argument('--compress-level', type=int, default=9, choices=range(1, 10), metavar='{1-9}', help='gzip compression level for the boot block')
+    create_batch_parser.add_argument('--compress-jobs', type=int, help='Compress the boot block on this many threads (reproducible for a given level)')
+    create_batch_parser.add_argument('--jobs', type=int, default=4, help='Number of images written concurrently')
 
     args = parser.parse_args()
 
+    if args.profile or args.profile_trace:
+        # Registered at exit so commands that sys.exit() still report
+        atexit.register(write_profile, profiler.enable(), args.profile, args.profile_trace)
+
+    manifest = {} if getattr(args, 'manifest', None) else None
+
     if args.command == 'extract':
         with open(args.file, "rb") as bin_file:
-            asafw.check_for_asa_fw_blob(bin_file)
-            asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, args.output_dir, not args.display_only))
-            # asafw.try_hash(bin_file)
+            if args.display_only:
+                with asafw.AsaBlockIndex(bin_file) as index:
+                    asafw.pprint_tree(asafw.get_blocks_from_index(index.root))
+                    if manifest is not None:
+                        manifest.update(asafw.get_index_manifest(index))
+            elif args.format == 'tar':
+                if args.jobs > 1 or args.cache_dir:
+                    parser.error('--format tar does not support --jobs or --cache-dir')
+                to_stdout = args.output == '-'
+                tar_file = sys.stdout.buffer if to_stdout else open(args.output, 'wb')
+                try:
+                    target = asafw.TarDumpTarget(tar_file, args.output_dir, os.fstat(bin_file.fileno()).st_mtime)
+                    asafw.check_for_asa_fw_blob(bin_file)
+                    blocks = asafw.get_blocks_from_file(bin_file, args.output_dir, True, manifest, target=target, only=args.only)
+                    target.close()
+                finally:
+                    if not to_stdout:
+                        tar_file.close()
+                # Keep stdout for the archive when it is being piped
+                asafw.pprint_tree(blocks, file=sys.stderr if to_stdout else None)
+            else:
+                extract_cache = None
+                if args.cache_dir:
+                    extract_cache = cache.ExtractCache(args.cache_dir, args.cache_max_size)
+                if args.jobs > 1:
+                    asafw.pprint_tree(asafw.get_blocks_from_file_parallel(
+                        args.file, args.output_dir, args.jobs, manifest, extract_cache, args.only))
+                else:
+                    asafw.check_for_asa_fw_blob(bin_file)
+                    asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, args.output_dir, True, manifest, extract_cache, only=args.only))
+    elif args.command == 'info':
+        for info in asafw.get_images_info(args.paths, args.jobs):
+            print(json.dumps(info))
+    elif args.command == 'boot-info':
+        print(json.dumps(asafw.get_boot_info(args.file)))
+    elif args.command == 'boot-read':
+        sys.stdout.buffer.write(asafw.read_boot_block(args.file, args.offset, args.length))
+    elif args.command == 'ls-rootfs':
+        for entry, target in rootfs.list_rootfs(args.file, args.patterns):
+            print(str(entry) if target is None else f"{entry} -> {target}")
+    elif args.command == 'cat-rootfs':
+        if args.output_dir:
+            found = rootfs.extract_rootfs(args.file, args.patterns, args.output_dir)
+        else:
+            found = rootfs.cat_rootfs(args.file, args.patterns, sys.stdout.buffer)
+        if not found:
+            print(f"No rootfs members match {' '.join(args.patterns)}", file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'verify':
+        failed = False
+        for report in verify.verify_images(args.paths, args.jobs):
+            print(json.dumps(report.to_dict(args.strict)))
+            failed = failed or not report.ok(args.strict)
+        if failed:
+            sys.exit(1)
+    elif args.command == 'verify-signature':
+        public_key = signature.get_public_key(release_key_p)
+        signature_cache = None if args.no_cache else signature.SignatureCache(args.cache)
+        failed = False
+        for result in signature.verify_signatures(args.paths, public_key, args.offset, args.length, signature_cache, args.jobs):
+            print(json.dumps(result))
+            failed = failed or not result["valid"]
+        if failed:
+            sys.exit(1)
+    elif args.command == 'carve':
+        for result in carve.carve(args.file, args.output_dir, args.jobs, args.all):
+            print(json.dumps(result))
+    elif args.command == 'patch':
+        if args.kernel_options is None and args.rootfs is None:
+            parser.error('patch needs --kernel-options and/or --rootfs')
+        if args.rootfs is not None:
+            with open(args.rootfs, 'rb') as input_rootfs:
+                patch.patch_image(args.file, args.output, args.kernel_options, input_rootfs)
+        else:
+            patch.patch_image(args.file, args.output, args.kernel_options)
+    elif args.command == 'diff':
+        with open(args.old, 'rb') as old_file, open(args.new, 'rb') as new_file, open(args.output, 'wb') as delta_file:
+            stats = delta.diff_images(old_file, new_file, delta_file)
+            print(f"copied {hex(stats['copied'])} literal {hex(stats['literal'])} delta {hex(delta_file.tell())}")
+    elif args.command == 'apply':
+        with open(args.old, 'rb') as old_file, open(args.delta, 'rb') as delta_file, open(args.output, 'w+b') as output_file:
+            delta.apply_delta(old_file, delta_file, output_file)
+    elif args.command == 'search-hash':
+        start_range = None
+        if args.start_range:
+            start, end = args.start_range.split(':')
+            start_range = (int(start, 0), int(end, 0))
+
+        def progress(searched, total, matches):
+            for algorithm, start, end, digest in matches:
+                print(f"{algorithm} [{hex(start)}:{hex(end)}] {digest}")
+            print(f"\r[{searched}/{total}]", end='', file=sys.stderr, flush=True)
+
+        try:
+            matches = hashsearch.search_hashes(args.file, args.digest, args.algorithm, args.jobs, start_range,
+                                               args.structural_only, not args.all, progress)
+        except ValueError as e:
+            parser.error(str(e))
+        print(file=sys.stderr)
+        if not matches:
+            sys.exit(1)
     elif args.command == 'create':
         if args.create_command == 'boot':
             with open(args.file, 'rb') as input_block:
                 with open(args.output, 'wb') as output_block:
-                    asafw.create_boot_block(output_block, input_block)
+                    asafw.create_boot_block(output_block, input_block, args.compress_level, args.compress_jobs)
         if args.create_command == 'fw':
             with open(args.kernel, 'rb') as input_kernel:
                 with open(args.rootfs, 'rb') as input_rootfs:
                     with open(args.output, 'wb') as bin_file:
-                        asafw.write_asa(bin_file, asafw.gen_blocks(rootfs_block=input_rootfs, kernel_block=input_kernel, kernel_options=args.kernel_options))
+                        asafw.write_asa(bin_file, asafw.gen_blocks(
+                            rootfs_block=input_rootfs,
+                            kernel_block=input_kernel,
+                            kernel_options=args.kernel_options,
+                            compress_level=args.compress_level,
+                            compress_jobs=args.compress_jobs
+                        ), manifest)
+        if args.create_command == 'fw-batch':
+            with open(args.variants, newline='') as variants_file:
+                variants = batch.load_variants(variants_file, args.format)
+            for result in batch.build_images(variants, args.kernel, args.rootfs, args.output_dir,
+                                             args.compress_level, args.compress_jobs, args.jobs):
+                print(json.dumps(result))
+
+    if manifest is not None:
+        with open(args.manifest, 'w') as manifest_file:
+            asafw.write_manifest(manifest, manifest_file)
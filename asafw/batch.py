@@ -0,0 +1,61 @@
+import concurrent.futures
+import csv
+import json
+import os
+import tempfile
+import asafw.asafw as asafw
+
+VARIANT_FIELDS = ("output", "serial", "magic_key", "kernel_options")
+
+
+def parse_variant(variant):
+    unknown = set(variant) - set(VARIANT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown variant fields {', '.join(sorted(unknown))}")
+    if not variant.get("output"):
+        raise ValueError(f"Variant {variant} has no output")
+    # Empty CSV cells and missing keys keep the gen_blocks defaults
+    kargs = {key: value for key, value in variant.items() if key != "output" and value not in (None, "")}
+    if "magic_key" in kargs:
+        kargs["magic_key"] = bytes.fromhex(kargs["magic_key"])
+    return variant["output"], kargs
+
+
+def load_variants(variants_file, file_format=None):
+    if file_format is None:
+        file_format = "json" if variants_file.name.endswith(".json") else "csv"
+    if file_format == "json":
+        variants = json.load(variants_file)
+    else:
+        variants = list(csv.DictReader(variants_file))
+    return [parse_variant(variant) for variant in variants]
+
+
+def write_variant(output_path, kargs, rootfs_path, boot_path):
+    # Every image gets its own handles, copy_file works from the file positions
+    with open(rootfs_path, "rb") as rootfs_block, open(boot_path, "rb") as boot_block, \
+            open(output_path, "wb") as bin_file:
+        asafw.write_asa(bin_file, asafw.gen_blocks(rootfs_block=rootfs_block, boot_block=boot_block, **kargs))
+        return {"output": output_path, "size": bin_file.tell()}
+
+
+def build_images(variants, kernel_path, rootfs_path, output_directory=".", compress_level=9, compress_jobs=None, jobs=4):
+    """Writes one image per variant, the boot block is compressed only once for all of them.
+
+    Only the headers and metadata are written from Python, the rootfs and boot payloads are copied
+    by the kernel (copy_file_range, which reflinks where the filesystem supports it).
+    """
+    outputs = [os.path.join(output_directory, output_path) for output_path, _ in variants]
+    if len(set(map(os.path.abspath, outputs))) != len(outputs):
+        raise ValueError("Variants share an output file")
+
+    os.makedirs(output_directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=output_directory, prefix=".boot-") as boot_block:
+        with open(kernel_path, "rb") as kernel_block:
+            asafw.compress_boot_block(kernel_block, compress_level, compress_jobs, boot_block)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(
+                lambda output: write_variant(output[0], output[1], rootfs_path, boot_block.name),
+                zip(outputs, (kargs for _, kargs in variants))
+            )
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import asafw.asafw as asafw
+import asafw.util as util
+
+RESULTS_SCHEMA = 1
+GENERATOR_CHUNK_SIZE = 0x100000
+KERNEL_RATIO = 16
+
+
+def _sample_headers(count):
+    headers = []
+    for i in range(count):
+        header = asafw.AsaBlockHeader(UUID=asafw.UUID_ROOTFS_FW_BLOCK, HasSubBlocks=(i % 2 == 0))
+        header.MetaDataLength = (i % 0x100) << 4
+        header.DataLength = (i * 0x10) & 0x0ffffff0
+        headers.append(header.pack())
+    return b''.join(headers)
+
+
+def _time_headers(count, decode):
+    start = time.perf_counter()
+    decode()
+    elapsed = time.perf_counter() - start
+    return {"headers": count, "seconds": elapsed, "headers_per_second": count / elapsed}
+
+
+def bench_header_codec(count=100000):
+    raw_headers = _sample_headers(count)
+    view = memoryview(raw_headers)
+    size = asafw.AsaBlockHeader.size
+
+    def decode_cstruct():
+        for offset in range(0, len(raw_headers), size):
+            header = asafw.asa_block(raw_headers[offset:offset + size])
+            header.UUID, header.MetaDataLength, header.DataLength, header.HasSubBlocks
+
+    def decode_struct():
+        for offset in range(0, len(raw_headers), size):
+            header = asafw.AsaBlockHeader.unpack_from(view, offset)
+            header.UUID, header.MetaDataLength, header.DataLength, header.HasSubBlocks
+
+    def encode_cstruct():
+        for _ in range(count):
+            asafw.asa_block(UUID=asafw.UUID_ROOTFS_FW_BLOCK, MetaDataLength=0x10, DataLength=0x100).pack()
+
+    output = bytearray(len(raw_headers))
+
+    def encode_struct():
+        for offset in range(0, len(output), size):
+            asafw.AsaBlockHeader(UUID=asafw.UUID_ROOTFS_FW_BLOCK, MetaDataLength=0x10, DataLength=0x100).pack_into(output, offset)
+
+    results = {
+        "decode_cstruct": _time_headers(count, decode_cstruct),
+        "decode_struct": _time_headers(count, decode_struct),
+        "encode_cstruct": _time_headers(count, encode_cstruct),
+        "encode_struct": _time_headers(count, encode_struct),
+    }
+    results["decode_speedup"] = results["decode_struct"]["headers_per_second"] / results["decode_cstruct"]["headers_per_second"]
+    results["encode_speedup"] = results["encode_struct"]["headers_per_second"] / results["encode_cstruct"]["headers_per_second"]
+    return results
+
+
+def _gen_text_pool(rng):
+    # Word-like text, generated once and sliced at random offsets, building it per chunk dominated the setup
+    words = [bytes(rng.choices(b"abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 10))) for _ in range(512)]
+    return b" ".join(rng.choices(words, k=GENERATOR_CHUNK_SIZE // 2))
+
+
+def _write_payload(output_file, size, compressible, rng):
+    # Compressible data is word-like text, random data defeats gzip entirely
+    pool = _gen_text_pool(rng) if compressible else None
+    remaining = size
+    while remaining > 0:
+        length = min(remaining, GENERATOR_CHUNK_SIZE)
+        if compressible:
+            start = rng.randrange(len(pool) - length + 1)
+            chunk = pool[start:start + length]
+        else:
+            chunk = rng.randbytes(length)
+        output_file.write(chunk)
+        remaining -= length
+
+
+def gen_synthetic_inputs(directory, size, compressible=True, seed=0):
+    rng = random.Random(seed)
+    rootfs_path = os.path.join(directory, "rootfs.bin")
+    kernel_path = os.path.join(directory, "kernel.bin")
+
+    with open(rootfs_path, "wb") as rootfs_file:
+        if compressible:
+            # A real rootfs block is a gzip'd archive, so extract has something to inflate
+            with asafw.GzipStreamWriter(rootfs_file, 1) as gzip_rootfs:
+                _write_payload(gzip_rootfs, size, True, rng)
+        else:
+            _write_payload(rootfs_file, size, False, rng)
+
+    with open(kernel_path, "wb") as kernel_file:
+        kernel_file.write(b"\x7fELF")
+        _write_payload(kernel_file, max(size // KERNEL_RATIO, 0x10), True, rng)
+
+    return rootfs_path, kernel_path
+
+
+def gen_synthetic_image(path, rootfs_path, kernel_path):
+    with open(rootfs_path, "rb") as rootfs_block, open(kernel_path, "rb") as kernel_block:
+        with open(path, "wb") as bin_file:
+            asafw.write_asa(bin_file, asafw.gen_blocks(rootfs_block=rootfs_block, kernel_block=kernel_block))
+    return os.path.getsize(path)
+
+
+def _run_parse(paths):
+    with open(paths["image"], "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        asafw.get_blocks_from_file(bin_file, paths["output"])
+    return os.path.getsize(paths["image"])
+
+
+def _run_index(paths):
+    with open(paths["image"], "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            sum(1 for _ in index.walk())
+    return os.path.getsize(paths["image"])
+
+
+def _run_extract(paths):
+    with open(paths["image"], "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        asafw.get_blocks_from_file(bin_file, paths["output"], True)
+    shutil.rmtree(paths["output"], ignore_errors=True)
+    return os.path.getsize(paths["image"])
+
+
+def _run_create_fw(paths):
+    return gen_synthetic_image(paths["output_image"], paths["rootfs"], paths["kernel"])
+
+
+def _run_create_boot(paths):
+    with open(paths["kernel"], "rb") as input_block, open(paths["output_image"], "wb") as output_block:
+        asafw.create_boot_block(output_block, input_block)
+    return os.path.getsize(paths["kernel"])
+
+
+BENCHMARKS = {
+    "parse": _run_parse,
+    "index": _run_index,
+    "extract": _run_extract,
+    "create_fw": _run_create_fw,
+    "create_boot": _run_create_boot,
+}
+
+
+def get_peak_rss_kb():
+    # ru_maxrss survives execve, so a spawned child would report the parent's peak. VmHWM belongs to
+    # the new address space only.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(name, paths):
+    start = time.perf_counter()
+    processed = BENCHMARKS[name](paths)
+    elapsed = time.perf_counter() - start
+    return processed, elapsed, get_peak_rss_kb()
+
+
+def run_benchmark(name, paths, isolate=True):
+    if not isolate:
+        return _measure(name, paths)
+    # A fresh interpreter per run so the VmHWM read by get_peak_rss_kb is the peak of that benchmark alone
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure, (name, paths))
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes, rootfs_kinds=("compressible",), benchmarks=None, repeat=1, seed=0, isolate=True, work_dir=None):
+    benchmarks = benchmarks or list(BENCHMARKS)
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        for size in sizes:
+            for kind in rootfs_kinds:
+                rootfs_path, kernel_path = gen_synthetic_inputs(directory, size, kind == "compressible", seed)
+                paths = {
+                    "rootfs": rootfs_path,
+                    "kernel": kernel_path,
+                    "image": os.path.join(directory, "image.bin"),
+                    "output_image": os.path.join(directory, "output.bin"),
+                    "output": os.path.join(directory, "extract"),
+                }
+                image_size = gen_synthetic_image(paths["image"], rootfs_path, kernel_path)
+
+                for name in benchmarks:
+                    runs = [run_benchmark(name, paths, isolate) for _ in range(repeat)]
+                    processed = runs[0][0]
+                    seconds = min(run[1] for run in runs)
+                    results.append({
+                        "benchmark": name,
+                        "rootfs": kind,
+                        "size": size,
+                        "image_size": image_size,
+                        "bytes": processed,
+                        "seconds": round(seconds, 6),
+                        "mb_per_second": round(processed / seconds / (1 << 20), 3) if seconds > 0 else None,
+                        "peak_rss_kb": max(run[2] for run in runs),
+                    })
+
+    return {
+        "schema": RESULTS_SCHEMA,
+        "commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def _result_key(result):
+    return (result["benchmark"], result["rootfs"], result["size"])
+
+
+def compare_results(baseline, current, threshold=0.1):
+    baseline_results = {_result_key(result): result for result in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        previous = baseline_results.get(_result_key(result))
+        if previous is None:
+            continue
+        time_ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else None
+        rss_ratio = result["peak_rss_kb"] / previous["peak_rss_kb"] if previous["peak_rss_kb"] else None
+        comparison.append({
+            "benchmark": result["benchmark"],
+            "rootfs": result["rootfs"],
+            "size": result["size"],
+            "time_ratio": time_ratio,
+            "rss_ratio": rss_ratio,
+            "regression": any(ratio is not None and ratio > 1 + threshold for ratio in (time_ratio, rss_ratio)),
+        })
+    return comparison
+
+
+def format_ratio(ratio):
+    # No ratio when the baseline measured 0, as very short runs can
+    return "n/a" if ratio is None else f"x{ratio:.3f}"
+
+
+def write_results(results, output_file):
+    json.dump(results, output_file, indent=2, sort_keys=True)
+    output_file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASA Firmware tool benchmarks")
+    subparser = parser.add_subparsers(required=True)
+
+    headers_parser = subparser.add_parser('headers')
+    headers_parser.set_defaults(command='headers')
+    headers_parser.add_argument('--count', type=int, default=100000, help='Number of headers to decode and encode')
+
+    run_parser = subparser.add_parser('run')
+    run_parser.set_defaults(command='run')
+    run_parser.add_argument('--size', type=util.parse_size, action='append', help='Rootfs size to generate, e.g. 10M or 2G (repeatable, default 10M)')
+    run_parser.add_argument('--rootfs', choices=['compressible', 'random'], action='append', help='Kind of rootfs payload (repeatable, default compressible)')
+    run_parser.add_argument('--benchmark', choices=sorted(BENCHMARKS), action='append', help='Benchmark to run (repeatable, default all)')
+    run_parser.add_argument('--repeat', type=int, default=1, help='Runs per benchmark, the fastest is reported')
+    run_parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic payloads')
+    run_parser.add_argument('--work-dir', type=str, help='Directory for generated images (default: system temp)')
+    run_parser.add_argument('--output', type=str, help='Write JSON results to this file (default: stdout)')
+
+    compare_parser = subparser.add_parser('compare')
+    compare_parser.set_defaults(command='compare')
+    compare_parser.add_argument('baseline', type=str, help='Results from the baseline commit')
+    compare_parser.add_argument('current', type=str, help='Results from the commit under test')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown or RSS growth reported as a regression')
+
+    args = parser.parse_args()
+
+    if args.command == 'headers':
+        print(json.dumps(bench_header_codec(args.count), indent=2))
+    elif args.command == 'run':
+        results = run_suite(args.size or [10 << 20], args.rootfs or ['compressible'], args.benchmark,
+                            args.repeat, args.seed, work_dir=args.work_dir)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                write_results(results, output_file)
+        else:
+            write_results(results, sys.stdout)
+    elif args.command == 'compare':
+        with open(args.baseline) as baseline_file, open(args.current) as current_file:
+            comparison = compare_results(json.load(baseline_file), json.load(current_file), args.threshold)
+        for row in comparison:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(f"{row['benchmark']:<12} {row['rootfs']:<12} {row['size']:>12} "
+                  f"time {format_ratio(row['time_ratio'])} rss {format_ratio(row['rss_ratio'])} {flag}")
+        if any(row["regression"] for row in comparison):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
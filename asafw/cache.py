@@ -0,0 +1,129 @@
+import errno
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+from Crypto.Hash import SHA256
+import asafw.asafw as asafw
+
+FICLONE = 0x40049409
+
+ENTRY_FILE = "entry.json"
+TREE_DIRECTORY = "tree"
+
+
+def reflink_or_copy(src, dst):
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    # The extracted file must never share an inode with the cache entry, or editing it would corrupt the cache
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            return "reflink"
+        except OSError:
+            pass
+        asafw.copy_file(src_file, dst_file)
+    return "copy"
+
+
+class ExtractCache():
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, bin_file, header):
+        # The UUID is part of the key as it decides how the payload is unpacked
+        raw_file = bin_file.fileobj if isinstance(bin_file, asafw.DigestingFile) else bin_file
+        offset = raw_file.tell()
+        raw_hash = SHA256.new(header.UUID.bytes)
+        remaining = header.DataLength
+        while remaining > 0:
+            data = raw_file.read(min(remaining, asafw.COPY_CHUNK_SIZE))
+            if not data:
+                break
+            raw_hash.update(data)
+            remaining -= len(data)
+        raw_file.seek(offset, os.SEEK_SET)
+        return raw_hash.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _touch(self, entry):
+        try:
+            os.utime(os.path.join(entry, ENTRY_FILE))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _store(self, bin_file, header, key):
+        entry = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=".staging-")
+        try:
+            asafw.dump_block(bin_file, header, os.path.join(staging, TREE_DIRECTORY))
+            size = 0
+            for root, dirs, files in os.walk(staging):
+                size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+            with open(os.path.join(staging, ENTRY_FILE), "w") as entry_file:
+                json.dump({"uuid": str(header.UUID), "size": size}, entry_file)
+            try:
+                os.rename(staging, entry)
+            except OSError as e:
+                # Another extract stored the same block first
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+                shutil.rmtree(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self.evict(keep=entry)
+
+    def _copy_tree(self, entry, output_directory):
+        tree = os.path.join(entry, TREE_DIRECTORY)
+        for root, dirs, files in os.walk(tree):
+            target = os.path.join(output_directory, os.path.relpath(root, tree))
+            os.makedirs(target, exist_ok=True)
+            for file in files:
+                reflink_or_copy(os.path.join(root, file), os.path.join(target, file))
+        return tree
+
+    def dump_block(self, bin_file, header, output_directory):
+        key = self.get_key(bin_file, header)
+        entry = self.entry_path(key)
+        if self._touch(entry):
+            bin_file.seek(header.DataLength, os.SEEK_CUR)
+        else:
+            self._store(bin_file, header, key)
+        tree = self._copy_tree(entry, output_directory)
+        return asafw.describe_dumped_block(header, output_directory, tree)
+
+    def entries(self):
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    with open(os.path.join(entry, ENTRY_FILE)) as entry_file:
+                        size = json.load(entry_file)["size"]
+                    yield entry, os.stat(os.path.join(entry, ENTRY_FILE)).st_mtime, size
+                except (OSError, ValueError, KeyError):
+                    continue
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries(), key=lambda item: item[1])
+        total = sum(size for _, _, size in entries)
+        for entry, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            # Extracted trees hold their own links, so dropping an entry never breaks them
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,92 @@
+import concurrent.futures
+import mmap
+import os
+import asafw.asafw as asafw
+import asafw.verify as verify
+
+CARVE_CHUNK_SIZE = 0x4000000
+SIGNATURES = (
+    ("blob", asafw.UUID_ASA_FW_BLOB.bytes),
+    ("container", asafw.UUID_MAIN_CONTAINER.bytes),
+)
+# A signature starting in one chunk is still found when it runs into the next
+CHUNK_OVERLAP = max(len(signature) for _, signature in SIGNATURES) - 1
+
+
+def scan_range(file_name, start, end):
+    hits = []
+    with open(file_name, "rb") as bin_file, \
+            mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_map:
+        limit = min(end + CHUNK_OVERLAP, len(raw_map))
+        for kind, signature in SIGNATURES:
+            offset = raw_map.find(signature, start, limit)
+            while 0 <= offset < end:
+                hits.append((offset, kind))
+                offset = raw_map.find(signature, offset + 1, limit)
+    return hits
+
+
+def scan_file(file_name, jobs=None, chunk_size=CARVE_CHUNK_SIZE):
+    # Each worker maps the dump itself, the pages are shared through the page cache
+    file_size = os.path.getsize(file_name)
+    ranges = [(start, min(start + chunk_size, file_size)) for start in range(0, file_size, chunk_size)]
+    if jobs == 1 or len(ranges) <= 1:
+        results = [scan_range(file_name, start, end) for start, end in ranges]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                scan_range, [file_name] * len(ranges), [start for start, _ in ranges], [end for _, end in ranges]
+            ))
+    return sorted(hit for hits in results for hit in hits)
+
+
+def check_hit(view, offset, kind):
+    # The size comes from the main container header, the rest of the tree is checked like verify does
+    header_offset = offset + 0x10 if kind == "blob" else offset
+    result = {"offset": offset, "kind": kind, "valid": False}
+    if header_offset + asafw.AsaBlockHeader.size > len(view):
+        result["errors"] = ["truncated block header"]
+        return result
+    header = asafw.AsaBlockHeader.unpack_from(view, header_offset)
+    if header.UUID != asafw.UUID_MAIN_CONTAINER or not header.HasSubBlocks or header.DataLength == 0:
+        result["errors"] = [f"{hex(header_offset)}: not a main container header"]
+        return result
+
+    end = header_offset + asafw.AsaBlockHeader.size + header.MetaDataLength + header.DataLength
+    if end > len(view):
+        result["errors"] = [f"{hex(header_offset)}: image ends at {hex(end)}, past the end of the dump"]
+        return result
+    report = verify.VerifyReport(None)
+    with view[offset:end] as image_view:
+        verify.verify_view(image_view, report)
+    report.warnings = [warning for warning in report.warnings if "UUID_ASA_FW_BLOB" not in warning]
+    result.update(valid=report.ok(), size=end - offset, errors=report.errors, warnings=report.warnings)
+    return result
+
+
+def carve(file_name, output_directory=None, jobs=None, include_invalid=False):
+    hits = scan_file(file_name, jobs)
+    if not hits:
+        return
+    if output_directory is not None:
+        os.makedirs(output_directory, exist_ok=True)
+    with open(file_name, "rb") as bin_file:
+        with mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_map:
+            view = memoryview(raw_map)
+            try:
+                image_end = 0
+                for offset, kind in hits:
+                    # The container right after a blob, and anything embedded in an image, is part of that image
+                    if offset < image_end:
+                        continue
+                    result = check_hit(view, offset, kind)
+                    if result["valid"]:
+                        image_end = offset + result["size"]
+                        if output_directory is not None:
+                            result["output"] = os.path.join(output_directory, f"image-{offset:08x}.bin")
+                            with open(result["output"], "wb") as output_file:
+                                asafw.copy_range(bin_file.fileno(), output_file.fileno(), offset, 0, result["size"])
+                    if result["valid"] or include_invalid:
+                        yield result
+            finally:
+                view.release()
@@ -0,0 +1,239 @@
+import os
+import struct
+import zlib
+from Crypto.Hash import SHA256
+import asafw.asafw as asafw
+
+DELTA_MAGIC = b'ASAFWDLT'
+DELTA_VERSION = 1
+DELTA_HEADER = struct.Struct("<8sIQQ32s32s")
+
+OP_COPY = b'C'
+OP_DATA = b'D'
+OP_END = b'E'
+COPY_OP = struct.Struct("<QQ")
+DATA_OP = struct.Struct("<I")
+
+CHUNK_MARKER = b'\xa5'
+MIN_CHUNK_SIZE = 0x800
+MAX_CHUNK_FACTOR = 0x20
+MAX_CHUNKS = 0x10000
+MAX_LITERAL = 0x100000
+
+
+def get_view_hash(view):
+    raw_hash = SHA256.new()
+    for offset in range(0, len(view), asafw.COPY_CHUNK_SIZE):
+        raw_hash.update(view[offset:offset + asafw.COPY_CHUNK_SIZE])
+    return raw_hash.digest()
+
+
+def get_file_hash(fd, length):
+    raw_hash = SHA256.new()
+    offset = 0
+    while offset < length:
+        data = os.pread(fd, min(length - offset, asafw.COPY_CHUNK_SIZE), offset)
+        if not data:
+            break
+        raw_hash.update(data)
+        offset += len(data)
+    return raw_hash.digest()
+
+
+def views_equal(view, other):
+    # memoryview comparison goes element by element, bytes comparison is a memcmp
+    if len(view) != len(other):
+        return False
+    for offset in range(0, len(view), asafw.COPY_CHUNK_SIZE):
+        if bytes(view[offset:offset + asafw.COPY_CHUNK_SIZE]) != bytes(other[offset:offset + asafw.COPY_CHUNK_SIZE]):
+            return False
+    return True
+
+
+def get_chunk_size(length):
+    # Grow the chunks with the payload so the chunk table stays bounded
+    return max(MIN_CHUNK_SIZE, asafw.get_boundary_aligned_length(-(-length // MAX_CHUNKS)))
+
+
+def iter_chunks(view, chunk_size):
+    # Content defined boundaries: cut after the first marker byte past the minimum size, so an
+    # insertion only changes the chunks around it and the rest line up again with the old payload
+    length = len(view)
+    start = 0
+    while start < length:
+        end = min(start + MAX_CHUNK_FACTOR * chunk_size, length)
+        cut = end
+        window = start + chunk_size
+        while window < end:
+            found = bytes(view[window:min(window + chunk_size, end)]).find(CHUNK_MARKER)
+            if found >= 0:
+                cut = window + found + 1
+                break
+            window += chunk_size
+        yield start, cut
+        start = cut
+
+
+class DeltaWriter():
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.copied = 0
+        self.literal = 0
+        self._copy = None
+
+    def _flush_copy(self):
+        if self._copy is not None:
+            self.fileobj.write(OP_COPY + COPY_OP.pack(*self._copy))
+            self._copy = None
+
+    def copy(self, offset, length):
+        if length == 0:
+            return
+        self.copied += length
+        # Runs of unchanged blocks collapse into one op
+        if self._copy is not None and self._copy[0] + self._copy[1] == offset:
+            self._copy = (self._copy[0], self._copy[1] + length)
+            return
+        self._flush_copy()
+        self._copy = (offset, length)
+
+    def data(self, view):
+        if len(view) == 0:
+            return
+        self._flush_copy()
+        self.literal += len(view)
+        for offset in range(0, len(view), MAX_LITERAL):
+            chunk = view[offset:offset + MAX_LITERAL]
+            self.fileobj.write(OP_DATA + DATA_OP.pack(len(chunk)))
+            self.fileobj.write(chunk)
+
+    def close(self):
+        self._flush_copy()
+        self.fileobj.write(OP_END)
+
+
+def diff_payload(writer, old_view, old_offset, new_view):
+    chunk_size = get_chunk_size(len(old_view))
+    chunks = {}
+    for start, end in iter_chunks(old_view, chunk_size):
+        chunks.setdefault((end - start, zlib.crc32(old_view[start:end])), []).append(start)
+
+    literal_start = 0
+    for start, end in iter_chunks(new_view, chunk_size):
+        data = bytes(new_view[start:end])
+        match = None
+        for candidate in chunks.get((end - start, zlib.crc32(data)), ()):
+            if bytes(old_view[candidate:candidate + end - start]) == data:
+                match = candidate
+                break
+        if match is None:
+            # Keep the pending literal bounded instead of holding back arbitrarily much unmatched data
+            if end - literal_start >= MAX_LITERAL:
+                writer.data(new_view[literal_start:end])
+                literal_start = end
+            continue
+        writer.data(new_view[literal_start:start])
+        writer.copy(old_offset + match, end - start)
+        literal_start = end
+    writer.data(new_view[literal_start:])
+
+
+def _get_old_entries(old_index):
+    entries = {}
+    for entry in old_index.walk():
+        entries.setdefault(entry.path, []).append(entry)
+    return entries
+
+
+def diff_images(old_file, new_file, delta_file):
+    with asafw.AsaBlockIndex(old_file) as old_index, asafw.AsaBlockIndex(new_file) as new_index:
+        old_view = old_index.view
+        new_view = new_index.view
+        delta_file.write(DELTA_HEADER.pack(
+            DELTA_MAGIC, DELTA_VERSION, len(old_view), len(new_view),
+            get_view_hash(old_view), get_view_hash(new_view)
+        ))
+        writer = DeltaWriter(delta_file)
+
+        def emit(new_range, old_range):
+            new_data = new_view[new_range[0]:new_range[1]]
+            if old_range is not None and views_equal(old_view[old_range[0]:old_range[1]], new_data):
+                writer.copy(old_range[0], len(new_data))
+            else:
+                writer.data(new_data)
+
+        emit((0, new_index.offset), (0, old_index.offset))
+
+        # Blocks pair up by UUID path, repeated paths in the order they appear
+        old_entries = _get_old_entries(old_index)
+        seen = {}
+        position = new_index.offset
+        for entry in new_index.walk():
+            occurrence = seen.get(entry.path, 0)
+            seen[entry.path] = occurrence + 1
+            matches = old_entries.get(entry.path, [])
+            old_entry = matches[occurrence] if occurrence < len(matches) else None
+
+            if position < entry.header_offset:
+                writer.data(new_view[position:entry.header_offset])
+            header_range = (entry.header_offset, entry.meta_range[0])
+            emit(header_range, None if old_entry is None else (old_entry.header_offset, old_entry.meta_range[0]))
+            emit(entry.meta_range, None if old_entry is None else old_entry.meta_range)
+            position = entry.meta_range[1]
+
+            if entry.header.HasSubBlocks:
+                continue
+            if old_entry is None or old_entry.header.HasSubBlocks:
+                writer.data(entry.data)
+            elif views_equal(old_entry.data, entry.data):
+                writer.copy(old_entry.data_range[0], entry.header.DataLength)
+            else:
+                diff_payload(writer, old_entry.data, old_entry.data_range[0], entry.data)
+            position = entry.data_range[1]
+
+        writer.data(new_view[position:])
+        writer.close()
+        return {"copied": writer.copied, "literal": writer.literal}
+
+
+def _read_exact(fileobj, length):
+    data = fileobj.read(length)
+    if len(data) != length:
+        raise ValueError("Delta is truncated")
+    return data
+
+
+def apply_delta(old_file, delta_file, output_file):
+    magic, version, old_size, new_size, old_digest, new_digest = DELTA_HEADER.unpack(
+        _read_exact(delta_file, DELTA_HEADER.size)
+    )
+    if magic != DELTA_MAGIC or version != DELTA_VERSION:
+        raise ValueError("Not an asafw delta")
+
+    old_fd = old_file.fileno()
+    if os.fstat(old_fd).st_size != old_size or get_file_hash(old_fd, old_size) != old_digest:
+        raise ValueError("Delta was not made against this image")
+
+    output_fd = output_file.fileno()
+    position = 0
+    while True:
+        op = _read_exact(delta_file, 1)
+        if op == OP_COPY:
+            offset, length = COPY_OP.unpack(_read_exact(delta_file, COPY_OP.size))
+            if offset + length > old_size:
+                raise ValueError(f"Delta copies past the end of the image at {hex(offset)}")
+            asafw.copy_range(old_fd, output_fd, offset, position, length)
+            position += length
+        elif op == OP_DATA:
+            length, = DATA_OP.unpack(_read_exact(delta_file, DATA_OP.size))
+            os.pwrite(output_fd, _read_exact(delta_file, length), position)
+            position += length
+        elif op == OP_END:
+            break
+        else:
+            raise ValueError(f"Unknown delta op {op!r}")
+
+    os.ftruncate(output_fd, position)
+    if position != new_size or get_file_hash(output_fd, position) != new_digest:
+        raise ValueError("Rebuilt image does not match the delta")
+    return position
@@ -0,0 +1,121 @@
+import struct
+
+FIELD1_HEADER = struct.Struct(">BH")
+FIELD1_TERMINATOR = 0xeb
+FIELD1_MAX_LENGTH = 0xffff
+
+# Field ids that hold nested fields instead of data, mapped to the schema of their children
+MAIN_CONTAINER_SCHEMA = {3: {}}
+
+
+class Field1():
+    """One TLV of the main container metadata, data is a memoryview into the decoded buffer or a list of fields."""
+
+    __slots__ = ("field", "data")
+
+    def __init__(self, field, data=b''):
+        self.field = field
+        self.data = data
+
+    @property
+    def length(self):
+        return get_size(self.data) if isinstance(self.data, list) else len(self.data)
+
+    def pack(self):
+        return encode([self], terminator=False)
+
+    def __str__(self):
+        # Same text as asa_field1, so the extract tree reads as it always has
+        data = self.data if isinstance(self.data, list) else bytes(self.data)
+        return f"asa_field1(field={self.field}, length={self.length}, data={data})"
+
+    __repr__ = __str__
+
+
+def decode(view, schema=MAIN_CONTAINER_SCHEMA):
+    """Returns the fields up to the terminator, or the end of view, and the offset decoding stopped at.
+
+    Data is sliced out of view rather than copied. Nesting is walked with an explicit stack, so
+    it is only bound by the length of the metadata.
+    """
+    view = memoryview(view)
+    fields = []
+    stack = [(fields, schema, len(view))]
+    offset = 0
+    while True:
+        children, children_schema, end = stack[-1]
+        if offset >= end:
+            if len(stack) == 1:
+                break
+            stack.pop()
+            continue
+        if len(stack) == 1 and view[offset] == FIELD1_TERMINATOR:
+            offset += 1
+            break
+        if offset + FIELD1_HEADER.size > end:
+            raise ValueError(f"Truncated field1 header at {hex(offset)}")
+
+        field, length = FIELD1_HEADER.unpack_from(view, offset)
+        data_start = offset + FIELD1_HEADER.size
+        data_end = data_start + length
+        if data_end > end:
+            raise ValueError(f"field1 {field} at {hex(offset)} runs past its container at {hex(end)}")
+        if field in children_schema:
+            item = Field1(field, [])
+            stack.append((item.data, children_schema[field], data_end))
+            offset = data_start
+        else:
+            item = Field1(field, view[data_start:data_end])
+            offset = data_end
+        children.append(item)
+    return fields, offset
+
+
+def get_size(fields):
+    size = 0
+    stack = list(fields)
+    while stack:
+        item = stack.pop()
+        size += FIELD1_HEADER.size
+        if isinstance(item.data, list):
+            stack.extend(item.data)
+        else:
+            size += len(item.data)
+    return size
+
+
+def encode_into(buffer, fields, offset=0):
+    # Container lengths are only known once their children are written, so their headers are patched on the way out
+    stack = [(iter(fields), None, None)]
+    while stack:
+        children, header_offset, field = stack[-1]
+        item = next(children, None)
+        if item is None:
+            stack.pop()
+            if header_offset is not None:
+                length = offset - header_offset - FIELD1_HEADER.size
+                if length > FIELD1_MAX_LENGTH:
+                    raise ValueError(f"field1 {field} is {hex(length)} bytes, longer than {hex(FIELD1_MAX_LENGTH)}")
+                FIELD1_HEADER.pack_into(buffer, header_offset, field, length)
+            continue
+
+        if isinstance(item.data, list):
+            stack.append((iter(item.data), offset, item.field))
+            offset += FIELD1_HEADER.size
+        else:
+            length = len(item.data)
+            if length > FIELD1_MAX_LENGTH:
+                raise ValueError(f"field1 {item.field} is {hex(length)} bytes, longer than {hex(FIELD1_MAX_LENGTH)}")
+            FIELD1_HEADER.pack_into(buffer, offset, item.field, length)
+            offset += FIELD1_HEADER.size
+            buffer[offset:offset + length] = item.data
+            offset += length
+    return offset
+
+
+def encode(fields, terminator=True):
+    buffer = bytearray(get_size(fields) + terminator)
+    offset = encode_into(buffer, fields)
+    if terminator:
+        buffer[offset] = FIELD1_TERMINATOR
+    return bytes(buffer)
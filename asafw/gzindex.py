@@ -0,0 +1,85 @@
+import bisect
+import zlib
+
+DEFAULT_SPAN = 0x100000
+INPUT_CHUNK_SIZE = 0x10000
+
+
+class AccessPoint():
+    __slots__ = ("in_offset", "out_offset", "decompressor")
+
+    def __init__(self, in_offset, out_offset, decompressor):
+        self.in_offset = in_offset
+        self.out_offset = out_offset
+        self.decompressor = decompressor
+
+
+class GzipIndex():
+    """zran style random access into a gzip member.
+
+    The inflate state is snapshotted with decompressobj.copy() every span bytes of output,
+    so a read only inflates from the nearest snapshot before it. zlib does not expose the
+    bit position of a snapshot, which is what an on-disk index would need, so the points
+    only live as long as the index. They are recorded lazily, up to the furthest offset read.
+    """
+
+    def __init__(self, view, span=DEFAULT_SPAN):
+        self.view = view
+        self.span = span
+        self.points = [AccessPoint(0, 0, zlib.decompressobj(16 + zlib.MAX_WBITS))]
+        self.size = None
+
+    def __len__(self):
+        self.build()
+        return self.size
+
+    def _inflate(self, point, out_offset, length=None):
+        # Yields (offset, data) for the output of the member, starting from a copy of point
+        decompressor = point.decompressor.copy()
+        in_offset = point.in_offset
+        position = point.out_offset
+        pending = b''
+        while not decompressor.eof:
+            if not pending:
+                if in_offset >= len(self.view):
+                    raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+                pending = self.view[in_offset:in_offset + INPUT_CHUNK_SIZE]
+                in_offset += len(pending)
+            max_length = self.span if length is None else out_offset + length - position
+            data = decompressor.decompress(pending, max(max_length, 1))
+            pending = decompressor.unconsumed_tail
+            yield in_offset - len(pending), position, data, decompressor
+            position += len(data)
+            if length is not None and position >= out_offset + length:
+                return
+
+    def _extend(self, out_offset=None):
+        point = self.points[-1]
+        for in_offset, position, data, decompressor in self._inflate(point, point.out_offset):
+            end = position + len(data)
+            if decompressor.eof:
+                self.size = end
+                return
+            if end >= point.out_offset + self.span:
+                point = AccessPoint(in_offset, end, decompressor.copy())
+                self.points.append(point)
+                if out_offset is not None and end > out_offset:
+                    return
+
+    def build(self):
+        if self.size is None:
+            self._extend()
+        return self
+
+    def read(self, offset, length):
+        if self.size is None and offset >= self.points[-1].out_offset:
+            self._extend(offset)
+        if self.size is not None:
+            length = max(0, min(length, self.size - offset))
+        point = self.points[bisect.bisect_right([point.out_offset for point in self.points], offset) - 1]
+
+        result = bytearray()
+        for _, position, data, _ in self._inflate(point, offset, length):
+            start = max(offset - position, 0)
+            result += data[start:offset + length - position]
+        return bytes(result)
@@ -0,0 +1,177 @@
+import collections
+import mmap
+import multiprocessing
+import os
+from Crypto.Hash import MD5, SHA512, SHA256
+import asafw.asafw as asafw
+
+ALGORITHMS = {
+    "sha512": SHA512,
+    "sha256": SHA256,
+    "md5": MD5,
+}
+
+DIGEST_LENGTHS = {module.digest_size * 2: name for name, module in ALGORITHMS.items()}
+
+STARTS_PER_TASK = 16
+
+_worker_view = None
+_worker_stop = None
+
+
+def algorithms_for_targets(targets):
+    return sorted({DIGEST_LENGTHS[len(target)] for target in targets if len(target) in DIGEST_LENGTHS})
+
+
+def get_boundaries(bin_file):
+    # Every header, metadata and data edge of the parsed tree, plus the ends of the file
+    starts = {0}
+    ends = set()
+    bin_file.seek(0, os.SEEK_END)
+    file_size = bin_file.tell()
+    bin_file.seek(0, os.SEEK_SET)
+    ends.add(file_size)
+    try:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            starts.add(index.offset)
+            for entry in index.walk():
+                starts.update((entry.header_offset, entry.meta_range[0], entry.data_range[0]))
+                ends.update((entry.header_offset, entry.meta_range[1], entry.data_range[1]))
+    except ValueError:
+        pass
+    ends.discard(0)
+    return sorted(starts), sorted(ends), file_size
+
+
+def search_ranges(view, starts, ends, targets, algorithms, stop=None):
+    matches = []
+    for start in starts:
+        if stop is not None and stop.is_set():
+            break
+        hashes = {name: ALGORITHMS[name].new() for name in algorithms}
+        position = start
+        for end in ends:
+            if end <= start:
+                continue
+            while position < end:
+                chunk_end = min(end, position + asafw.COPY_CHUNK_SIZE)
+                for raw_hash in hashes.values():
+                    raw_hash.update(view[position:chunk_end])
+                position = chunk_end
+            for name, raw_hash in hashes.items():
+                digest = raw_hash.copy().hexdigest()
+                if digest in targets:
+                    matches.append((name, start, end, digest))
+    return matches
+
+
+def _init_worker(file_name, stop):
+    global _worker_view, _worker_stop
+    with open(file_name, "rb") as bin_file:
+        _worker_view = memoryview(mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ))
+    _worker_stop = stop
+
+
+def _search_worker(starts, ends, targets, algorithms):
+    return len(starts), search_ranges(_worker_view, starts, ends, targets, algorithms, _worker_stop)
+
+
+def get_candidate_starts(structural_starts, file_size, start_range=None, structural_only=False):
+    low, high = start_range if start_range is not None else (0, file_size)
+    high = min(high, file_size)
+    structural = [offset for offset in structural_starts if low <= offset < high]
+    yield from structural
+    if structural_only:
+        return
+
+    structural = set(structural)
+    for offset in range(low + (-low % 0x10), high, 0x10):
+        if offset not in structural:
+            yield offset
+    for offset in range(low, high):
+        if offset % 0x10 and offset not in structural:
+            yield offset
+
+
+def _batches(offsets, size):
+    batch = []
+    for offset in offsets:
+        batch.append(offset)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _SearchState():
+    def __init__(self, targets, total, stop_when_found, progress):
+        self.targets = targets
+        self.total = total
+        self.stop_when_found = stop_when_found
+        self.progress = progress
+        self.searched = 0
+        self.matches = []
+        self.found = set()
+
+    def collect(self, count, matches):
+        self.searched += count
+        self.matches.extend(matches)
+        self.found.update(match[3] for match in matches)
+        if self.progress is not None:
+            self.progress(self.searched, self.total, matches)
+        return self.stop_when_found and self.found >= self.targets
+
+
+def search_hashes(file_name, targets, algorithms=None, jobs=1, start_range=None,
+                  structural_only=False, stop_when_found=True, progress=None):
+    targets = {target.lower() for target in targets}
+    names = ALGORITHMS if algorithms is None else algorithms
+    lengths = {ALGORITHMS[name].digest_size * 2 for name in names}
+    for target in sorted(targets):
+        if len(target) not in lengths:
+            raise ValueError(f"Digest {target} does not have the length of a {', '.join(sorted(names))} digest")
+    if algorithms is None:
+        algorithms = algorithms_for_targets(targets)
+    if not algorithms:
+        raise ValueError("No hash algorithm to search with")
+
+    with open(file_name, "rb") as bin_file:
+        structural_starts, ends, file_size = get_boundaries(bin_file)
+
+    low, high = start_range if start_range is not None else (0, file_size)
+    high = min(high, file_size)
+    if structural_only:
+        total = len([offset for offset in structural_starts if low <= offset < high])
+    else:
+        total = max(0, high - low)
+    state = _SearchState(targets, total, stop_when_found, progress)
+    batches = _batches(get_candidate_starts(structural_starts, file_size, start_range, structural_only), STARTS_PER_TASK)
+
+    if jobs is not None and jobs <= 1:
+        with open(file_name, "rb") as bin_file, \
+                mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_map:
+            view = memoryview(raw_map)
+            try:
+                for batch in batches:
+                    if state.collect(len(batch), search_ranges(view, batch, ends, targets, algorithms)):
+                        break
+            finally:
+                view.release()
+        return state.matches
+
+    jobs = jobs or os.cpu_count()
+    stop = multiprocessing.Event()
+    with multiprocessing.Pool(jobs, _init_worker, (file_name, stop)) as pool:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_search_worker, (batch, ends, targets, algorithms)))
+            # Keep a bounded number of batches queued, the exhaustive stages can hold millions of offsets
+            if len(pending) >= 4 * jobs and state.collect(*pending.popleft().get()):
+                stop.set()
+                return state.matches
+        while pending:
+            if state.collect(*pending.popleft().get()):
+                stop.set()
+                break
+    return state.matches
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import asafw.asafw as asafw
+
+MAX_META_DATA_LENGTH = asafw.MAX_META_DATA_LENGTH
+MAX_DATA_LENGTH = 0xffffffff >> 4
+
+
+class BlockReplacement():
+    def __init__(self, entry, meta_data=None, data_file=None):
+        self.entry = entry
+        self.meta_data = meta_data
+        self.data_file = data_file
+        self.header = asafw.AsaBlockHeader(entry.header.pack())
+
+        if meta_data is not None:
+            self.header.MetaDataLength = asafw.get_boundary_aligned_length(len(meta_data))
+            if self.header.MetaDataLength > MAX_META_DATA_LENGTH:
+                raise ValueError(f"Metadata for block {entry.UUID} is longer than {hex(MAX_META_DATA_LENGTH)}")
+        if data_file is not None:
+            self.data_length = os.fstat(data_file.fileno()).st_size
+            self.header.DataLength = asafw.get_boundary_aligned_length(self.data_length)
+            if self.header.DataLength > MAX_DATA_LENGTH:
+                raise ValueError(f"Data for block {entry.UUID} is longer than {hex(MAX_DATA_LENGTH)}")
+
+    @property
+    def delta(self):
+        old = self.entry.header.MetaDataLength + self.entry.header.DataLength
+        return self.header.MetaDataLength + self.header.DataLength - old
+
+    def write_meta_data(self, dst_fd, src_fd, offset):
+        if self.meta_data is None:
+            asafw.copy_range(src_fd, dst_fd, self.entry.meta_range[0], offset, self.header.MetaDataLength)
+        else:
+            os.pwrite(dst_fd, self.meta_data.ljust(self.header.MetaDataLength, b'\x00'), offset)
+        return offset + self.header.MetaDataLength
+
+    def write_data(self, dst_fd, src_fd, offset):
+        if self.data_file is None:
+            asafw.copy_range(src_fd, dst_fd, self.entry.data_range[0], offset, self.header.DataLength)
+        else:
+            asafw.copy_range(self.data_file.fileno(), dst_fd, 0, offset, self.data_length)
+            padding = self.header.DataLength - self.data_length
+            if padding:
+                os.pwrite(dst_fd, bytes(padding), offset + self.data_length)
+        return offset + self.header.DataLength
+
+
+def _patch_in_place(fd, replacements):
+    # Sizes are unchanged, so only the replaced parts are written, the rest is already in place
+    for replacement in replacements:
+        if replacement.meta_data is not None:
+            replacement.write_meta_data(fd, None, replacement.entry.meta_range[0])
+        if replacement.data_file is not None:
+            replacement.write_data(fd, None, replacement.entry.data_range[0])
+
+
+def _patch_to_file(src_fd, dst_fd, file_size, index, replacements):
+    # Untouched ranges between the replaced blocks are copied by the kernel
+    position = 0
+    output_offset = 0
+    for replacement in replacements:
+        entry = replacement.entry
+        asafw.copy_range(src_fd, dst_fd, position, output_offset, entry.header_offset - position)
+        output_offset += entry.header_offset - position
+        os.pwrite(dst_fd, replacement.header.pack(), output_offset)
+        output_offset = replacement.write_meta_data(dst_fd, src_fd, output_offset + asafw.AsaBlockHeader.size)
+        output_offset = replacement.write_data(dst_fd, src_fd, output_offset)
+        position = entry.data_range[1]
+    asafw.copy_range(src_fd, dst_fd, position, output_offset, file_size - position)
+    os.ftruncate(dst_fd, output_offset + file_size - position)
+
+    # Containers around a resized block take its size change, and move by whatever changed before them
+    for entry in index.walk():
+        if not entry.header.HasSubBlocks:
+            continue
+        header = asafw.AsaBlockHeader(entry.header.pack())
+        shift = 0
+        for replacement in replacements:
+            if replacement.entry.data_range[1] <= entry.header_offset:
+                shift += replacement.delta
+            elif entry.data_range[0] <= replacement.entry.header_offset < entry.data_range[1]:
+                header.DataLength += replacement.delta
+        if header.DataLength > MAX_DATA_LENGTH:
+            raise ValueError(f"Container {entry.UUID} would be longer than {hex(MAX_DATA_LENGTH)}")
+        if header.DataLength != entry.header.DataLength:
+            os.pwrite(dst_fd, header.pack(), entry.header_offset + shift)
+
+
+def patch_image(file_name, output_name=None, kernel_options=None, rootfs_file=None):
+    with open(file_name, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        replacements = []
+        if kernel_options is not None:
+            entries = index.find(asafw.UUID_KERNEL_PARAMS)
+            if not entries:
+                raise ValueError(f"{file_name} has no kernel params block")
+            replacements.append(BlockReplacement(entries[0], meta_data=bytes(kernel_options, "ascii")))
+        if rootfs_file is not None:
+            entries = index.find(asafw.UUID_ROOTFS_FW_BLOCK)
+            if not entries:
+                raise ValueError(f"{file_name} has no rootfs block")
+            replacements.append(BlockReplacement(entries[0], data_file=rootfs_file))
+        replacements.sort(key=lambda replacement: replacement.entry.header_offset)
+
+        in_place = output_name is None or os.path.abspath(output_name) == os.path.abspath(file_name)
+        if in_place and all(replacement.delta == 0 for replacement in replacements):
+            fd = os.open(file_name, os.O_WRONLY)
+            try:
+                _patch_in_place(fd, replacements)
+            finally:
+                os.close(fd)
+            return True
+
+        file_size = len(index)
+        if in_place:
+            output_dir = os.path.dirname(os.path.abspath(file_name))
+            dst_fd, dst_name = tempfile.mkstemp(dir=output_dir, prefix=".asafw-patch-")
+        else:
+            dst_name = output_name
+            dst_fd = os.open(output_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            _patch_to_file(bin_file.fileno(), dst_fd, file_size, index, replacements)
+        except BaseException:
+            os.close(dst_fd)
+            if in_place:
+                os.unlink(dst_name)
+            raise
+        os.close(dst_fd)
+
+    if in_place:
+        os.chmod(dst_name, os.stat(file_name).st_mode & 0o7777)
+        os.replace(dst_name, file_name)
+    return False
@@ -0,0 +1,103 @@
+import collections
+import concurrent.futures
+import io
+import os
+import struct
+import zlib
+import asafw.profiler as profiler
+
+DEFAULT_CHUNK_SIZE = 0x20000
+DICTIONARY_SIZE = 0x8000
+
+GZIP_OS_UNIX = 3
+
+
+def _compress_chunk(data, dictionary, compresslevel, last):
+    # Raw deflate, primed with the tail of the previous chunk so the ratio stays close to single-stream gzip
+    if dictionary:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    result = compressor.compress(data)
+    # A sync flush ends the chunk on a byte boundary so the next chunk's stream can be appended
+    result += compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return result
+
+
+def gzip_header(compresslevel):
+    if compresslevel == 9:
+        xfl = 2
+    elif compresslevel == 1:
+        xfl = 4
+    else:
+        xfl = 0
+    return struct.pack("<BBBBIBB", 0x1f, 0x8b, zlib.DEFLATED, 0, 0, xfl, GZIP_OS_UNIX)
+
+
+class ParallelGzipWriter():
+    def __init__(self, fileobj, compresslevel=9, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.chunk_size = chunk_size
+        self.jobs = jobs if jobs else os.cpu_count()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._crc = 0
+        self._offset = 0
+        self._closed = False
+        self.fileobj.write(gzip_header(compresslevel))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data):
+        length = len(data)
+        with profiler.phase("deflate", None, length):
+            self._crc = zlib.crc32(data, self._crc)
+            self._offset += length
+            self._buffer += data
+            while len(self._buffer) >= self.chunk_size:
+                self._submit(bytes(self._buffer[:self.chunk_size]), False)
+                del self._buffer[:self.chunk_size]
+        return length
+
+    def tell(self):
+        return self._offset
+
+    def seekable(self):
+        return False
+
+    def _submit(self, chunk, last):
+        self._pending.append(
+            self._executor.submit(_compress_chunk, chunk, self._dictionary, self.compresslevel, last)
+        )
+        self._dictionary = chunk[-DICTIONARY_SIZE:]
+        # Bound the amount of compressed and uncompressed data held in flight
+        while len(self._pending) > 2 * self.jobs:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            with profiler.phase("deflate"):
+                self._submit(bytes(self._buffer), True)
+                self._buffer = bytearray()
+                while self._pending:
+                    self.fileobj.write(self._pending.popleft().result())
+                self.fileobj.write(struct.pack("<II", self._crc, self._offset & 0xffffffff))
+        finally:
+            self._executor.shutdown()
+
+
+def compress(data, compresslevel=9, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    output = io.BytesIO()
+    with ParallelGzipWriter(output, compresslevel, jobs, chunk_size) as writer:
+        writer.write(data)
+    return output.getvalue()
@@ -0,0 +1,168 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Set by enable(), the hooks in the library only check this for None when profiling is off
+_profiler = None
+
+
+class _NullPhase():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, length):
+        pass
+
+    def label(self, block_uuid, length=0):
+        pass
+
+
+NULL_PHASE = _NullPhase()
+
+
+class Phase():
+    __slots__ = ("profiler", "name", "block_uuid", "length", "start", "child_time")
+
+    def __init__(self, profiler, name, block_uuid, length):
+        self.profiler = profiler
+        self.name = name
+        self.block_uuid = block_uuid
+        self.length = length
+        self.child_time = 0
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        # Phases that do not know their block, like hashing or deflate, belong to the one they run in
+        if self.block_uuid is None and stack:
+            self.block_uuid = stack[-1].block_uuid
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        self.profiler.events.append(PhaseEvent(
+            self.name, None if self.block_uuid is None else str(self.block_uuid), self.length,
+            self.start - self.profiler.origin, duration, duration - self.child_time, threading.get_ident()
+        ))
+        return False
+
+    def add(self, length):
+        self.length += length
+
+    def label(self, block_uuid, length=0):
+        # For phases that only learn which block they belong to part way through
+        self.block_uuid = block_uuid
+        self.length += length
+
+
+PhaseEvent = collections.namedtuple("PhaseEvent", ("name", "block_uuid", "length", "start", "duration", "self_time", "thread"))
+
+
+class Profiler():
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def phase(self, name, block_uuid=None, length=0):
+        return Phase(self, name, block_uuid, length)
+
+    def merge(self, origin, events):
+        # Events recorded by another process, perf_counter_ns is the same monotonic clock there
+        self.events.extend(event._replace(start=event.start + origin - self.origin) for event in events)
+
+    def summary(self):
+        # Self time, so nested phases (a copy inside a deflate) are not counted twice
+        rows = {}
+        for event in self.events:
+            row = rows.setdefault((event.name, event.block_uuid), {
+                "phase": event.name, "uuid": event.block_uuid, "calls": 0, "bytes": 0, "seconds": 0.0,
+            })
+            row["calls"] += 1
+            row["bytes"] += event.length
+            row["seconds"] += event.self_time / 1e9
+        for row in rows.values():
+            row["throughput"] = row["bytes"] / row["seconds"] if row["seconds"] and row["bytes"] else None
+        return sorted(rows.values(), key=lambda row: row["seconds"], reverse=True)
+
+    def write_summary(self, output_file):
+        print(f"{'phase':<14} {'uuid':<36} {'calls':>7} {'bytes':>12} {'seconds':>9} {'MB/s':>9}", file=output_file)
+        for row in self.summary():
+            throughput = "" if row["throughput"] is None else f"{row['throughput'] / 1e6:.1f}"
+            print(f"{row['phase']:<14} {row['uuid'] or '-':<36} {row['calls']:>7} {row['bytes']:>12} "
+                  f"{row['seconds']:>9.4f} {throughput:>9}", file=output_file)
+
+    def get_chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for event in self.events:
+            args = {"bytes": event.length}
+            if event.block_uuid is not None:
+                args["uuid"] = event.block_uuid
+            events.append({
+                "name": event.name,
+                "cat": "asafw",
+                "ph": "X",
+                "ts": event.start / 1e3,
+                "dur": event.duration / 1e3,
+                "pid": pid,
+                "tid": event.thread,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, output_file):
+        json.dump(self.get_chrome_trace(), output_file)
+
+
+def phase(name, block_uuid=None, length=0):
+    if _profiler is None:
+        return NULL_PHASE
+    return _profiler.phase(name, block_uuid, length)
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def merge(origin, events):
+    if _profiler is not None:
+        _profiler.merge(origin, events)
+
+
+def enable(profiler=None):
+    global _profiler
+    _profiler = Profiler() if profiler is None else profiler
+    return _profiler
+
+
+def disable():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+@contextlib.contextmanager
+def profiling(profiler=None):
+    profiler = enable(profiler)
+    try:
+        yield profiler
+    finally:
+        disable()
@@ -0,0 +1,229 @@
+import fnmatch
+import os
+import stat
+import asafw.asafw as asafw
+
+CPIO_NEWC_MAGIC = (b'070701', b'070702')
+CPIO_HEADER_SIZE = 110
+CPIO_TRAILER = "TRAILER!!!"
+CPIO_FIELDS = (
+    "ino", "mode", "uid", "gid", "nlink", "mtime", "size",
+    "devmajor", "devminor", "rdevmajor", "rdevminor", "namesize", "check",
+)
+
+
+def iter_block_data(bin_file, offset, length):
+    bin_file.seek(offset, os.SEEK_SET)
+    while length > 0:
+        data = bin_file.read(min(length, asafw.COPY_CHUNK_SIZE))
+        if not data:
+            raise EOFError(f"Block data ended {hex(length)} bytes early")
+        length -= len(data)
+        yield data
+
+
+def iter_payload_chunks(chunks):
+    # The rootfs is inflated a chunk at a time straight out of the image, never as a whole
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    if first[:len(asafw.GZIP_MAGIC)] != asafw.GZIP_MAGIC:
+        yield first
+        yield from chunks
+        return
+
+    decoder = asafw.GzipStreamDecoder()
+    yield from decoder.decompress(first)
+    for chunk in chunks:
+        yield from decoder.decompress(chunk)
+    decoder.flush()
+
+
+class ChunkStream():
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self.offset = 0
+
+    def _fill(self, length):
+        while len(self._buffer) < length:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._buffer += chunk
+        return True
+
+    def read(self, length):
+        if not self._fill(length):
+            raise EOFError(f"Archive ended at {hex(self.offset + len(self._buffer))}, expected {hex(length)} more bytes")
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        self.offset += length
+        return data
+
+    def iter_read(self, length):
+        # Large members go straight from the decompressor to the caller instead of through the buffer
+        while length > 0:
+            if not self._buffer and not self._fill(1):
+                raise EOFError(f"Archive ended at {hex(self.offset)}, expected {hex(length)} more bytes")
+            data = bytes(self._buffer[:length])
+            del self._buffer[:len(data)]
+            self.offset += len(data)
+            length -= len(data)
+            yield data
+
+    def skip(self, length):
+        for _ in self.iter_read(length):
+            pass
+
+    def skip_padding(self):
+        # Concatenated archives may be separated by NUL padding
+        while self._fill(1):
+            stripped = self._buffer.lstrip(b'\x00')
+            self.offset += len(self._buffer) - len(stripped)
+            self._buffer = stripped
+            if self._buffer:
+                return True
+        return False
+
+
+class CpioEntry():
+    __slots__ = CPIO_FIELDS + ("name", "data_offset")
+
+    def __init__(self, name, data_offset, **fields):
+        self.name = name
+        self.data_offset = data_offset
+        for field in CPIO_FIELDS:
+            setattr(self, field, fields[field])
+
+    @property
+    def path(self):
+        return os.path.normpath(self.name.lstrip("/")) if self.name not in (".", "/") else "."
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.mode)
+
+    def is_file(self):
+        return stat.S_ISREG(self.mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.mode)
+
+    def __str__(self):
+        return f"{stat.filemode(self.mode)} {self.uid}/{self.gid} {self.size:>10} {self.name}"
+
+
+def get_padding(length):
+    return -length % 4
+
+
+class CpioReader():
+    """Single pass newc reader, the data of each member can be read until the next one is requested."""
+
+    def __init__(self, chunks):
+        self.stream = ChunkStream(chunks)
+        self._remaining = 0
+
+    def __iter__(self):
+        while True:
+            self.stream.skip(self._remaining)
+            self._remaining = 0
+            if not self.stream.skip_padding():
+                return
+
+            header_offset = self.stream.offset
+            header = self.stream.read(CPIO_HEADER_SIZE)
+            if header[:6] not in CPIO_NEWC_MAGIC:
+                raise ValueError(f"Bad cpio header magic {header[:6]!r} at {hex(header_offset)}")
+            fields = {
+                field: int(header[6 + index * 8:14 + index * 8], 16)
+                for index, field in enumerate(CPIO_FIELDS)
+            }
+            name = self.stream.read(fields["namesize"]).rstrip(b'\x00').decode("utf-8", "surrogateescape")
+            self.stream.skip(get_padding(CPIO_HEADER_SIZE + fields["namesize"]))
+            if name == CPIO_TRAILER:
+                continue
+
+            entry = CpioEntry(name, self.stream.offset, **fields)
+            self._remaining = entry.size + get_padding(entry.size)
+            yield entry
+
+    def iter_data(self, entry):
+        if self.stream.offset != entry.data_offset:
+            raise ValueError(f"Data of {entry.name} has already been read past")
+        self._remaining = get_padding(entry.size)
+        yield from self.stream.iter_read(entry.size)
+
+    def read_data(self, entry):
+        return b''.join(self.iter_data(entry))
+
+
+def match_patterns(entry, patterns):
+    if not patterns:
+        return True
+    return any(fnmatch.fnmatchcase(entry.path, pattern.lstrip("/")) or fnmatch.fnmatchcase(entry.name, pattern)
+               for pattern in patterns)
+
+
+def iter_rootfs(file_name):
+    with open(file_name, "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            entries = index.find(asafw.UUID_ROOTFS_FW_BLOCK)
+            if not entries:
+                raise ValueError(f"{file_name} has no rootfs block")
+            data_range = entries[0].data_range
+
+        reader = CpioReader(iter_payload_chunks(iter_block_data(bin_file, data_range[0], data_range[1] - data_range[0])))
+        for entry in reader:
+            yield reader, entry
+
+
+def list_rootfs(file_name, patterns=None):
+    for reader, entry in iter_rootfs(file_name):
+        if not match_patterns(entry, patterns):
+            continue
+        if entry.is_symlink():
+            yield entry, reader.read_data(entry).decode("utf-8", "surrogateescape")
+        else:
+            yield entry, None
+
+
+def cat_rootfs(file_name, patterns, output):
+    found = []
+    for reader, entry in iter_rootfs(file_name):
+        if entry.is_file() and match_patterns(entry, patterns):
+            for data in reader.iter_data(entry):
+                output.write(data)
+            found.append(entry.name)
+    return found
+
+
+def extract_rootfs(file_name, patterns, output_directory):
+    extracted = []
+    for reader, entry in iter_rootfs(file_name):
+        if not match_patterns(entry, patterns):
+            continue
+        if entry.path == "." or entry.path.split(os.sep)[0] == "..":
+            continue
+        output_path = os.path.join(output_directory, entry.path)
+        # Symlinks extracted earlier must not redirect later members out of the output directory
+        parent = os.path.realpath(os.path.dirname(output_path))
+        if os.path.commonpath((parent, os.path.realpath(output_directory))) != os.path.realpath(output_directory):
+            continue
+        if entry.is_dir():
+            os.makedirs(output_path, exist_ok=True)
+        elif entry.is_file() or entry.is_symlink():
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if os.path.lexists(output_path):
+                os.unlink(output_path)
+            if entry.is_symlink():
+                os.symlink(reader.read_data(entry).decode("utf-8", "surrogateescape"), output_path)
+            else:
+                with open(output_path, "wb") as output_file:
+                    for data in reader.iter_data(entry):
+                        output_file.write(data)
+                os.chmod(output_path, stat.S_IMODE(entry.mode))
+        else:
+            # Device nodes and fifos need privileges and are of no use outside the image
+            continue
+        extracted.append(entry.name)
+    return extracted
@@ -0,0 +1,155 @@
+import concurrent.futures
+import io
+import json
+import os
+import tempfile
+import threading
+from Crypto.Hash import SHA256, SHA512
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+import asafw.asafw as asafw
+import asafw.profiler as profiler
+
+MAGIC_KEY_FIELD = 11
+MAGIC_KEY_LENGTH = 0x100
+RELEASE_KEY_EXPONENT = 65537
+CACHE_VERSION = 1
+
+
+def get_public_key(modulus, exponent=RELEASE_KEY_EXPONENT):
+    # The modulus is written as colon separated hex, the way openssl prints it
+    if isinstance(modulus, str):
+        modulus = int("".join(modulus.split()).replace(":", ""), 16)
+    return RSA.construct((modulus, exponent))
+
+
+def get_key_id(public_key):
+    return SHA256.new(public_key.n.to_bytes((public_key.n.bit_length() + 7) // 8, "big")).hexdigest()
+
+
+def get_signed_region(index, offset=None, length=None):
+    # Unless told otherwise, the signature covers the main container payload, everything after its metadata
+    if offset is None:
+        offset = index.root.data_range[0]
+    if length is None:
+        length = (index.root.data_range[1] if offset == index.root.data_range[0] else len(index)) - offset
+    if offset < 0 or length < 0 or offset + length > len(index):
+        raise ValueError(f"Signed region {hex(offset)}+{hex(length)} is outside the image")
+    return offset, length
+
+
+def get_magic_key(index):
+    if index.root.UUID != asafw.UUID_MAIN_CONTAINER or index.root.header.MetaDataLength == 0:
+        raise ValueError("Image has no main container metadata")
+    headers = asafw.parse_field1_headers(io.BytesIO(bytes(index.root.meta_data)))
+    header = asafw.find_field1(headers, MAGIC_KEY_FIELD)
+    if header is None or len(header.data) != MAGIC_KEY_LENGTH:
+        raise ValueError(f"Field {MAGIC_KEY_FIELD} is not a {MAGIC_KEY_LENGTH} byte signature")
+    return bytes(header.data)
+
+
+def hash_region(view, offset, length):
+    raw_hash = SHA512.new()
+    with profiler.phase("hash", length=length):
+        for start in range(offset, offset + length, asafw.COPY_CHUNK_SIZE):
+            raw_hash.update(view[start:min(start + asafw.COPY_CHUNK_SIZE, offset + length)])
+    return raw_hash
+
+
+def verify_signature(file_name, public_key, offset=None, length=None):
+    with open(file_name, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        offset, length = get_signed_region(index, offset, length)
+        signature = get_magic_key(index)
+        raw_hash = hash_region(index.view, offset, length)
+    try:
+        pkcs1_15.new(public_key).verify(raw_hash, signature)
+        valid = True
+    except ValueError:
+        valid = False
+    return {
+        "path": file_name,
+        "valid": valid,
+        "offset": offset,
+        "length": length,
+        "sha512": raw_hash.hexdigest(),
+    }
+
+
+class SignatureCache():
+    """Results keyed by path, trusted for as long as size, mtime and inode are unchanged."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def _get_stamp(file_name):
+        stat = os.stat(file_name)
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def get(self, file_name, key_id, offset, length):
+        entry = self.entries.get(os.path.abspath(file_name))
+        if entry is None or entry["stamp"] != self._get_stamp(file_name) or entry["key"] != key_id:
+            return None
+        if entry["region"] != [offset, length]:
+            return None
+        return entry["result"]
+
+    def put(self, file_name, key_id, offset, length, stamp, result):
+        with self._lock:
+            self.entries[os.path.abspath(file_name)] = {
+                "stamp": stamp, "key": key_id, "region": [offset, length], "result": result,
+            }
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".signatures-")
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, cache_file)
+        os.replace(temp_name, self.path)
+        self.dirty = False
+
+
+def get_default_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "asafw", "signatures.json")
+
+
+def _verify_cached(file_name, public_key, key_id, offset, length, cache):
+    try:
+        if cache is not None:
+            result = cache.get(file_name, key_id, offset, length)
+            if result is not None:
+                return dict(result, path=file_name, cached=True)
+            # Stat before reading, so a file replaced during the check is not cached under its new stamp
+            stamp = SignatureCache._get_stamp(file_name)
+        result = verify_signature(file_name, public_key, offset, length)
+        if cache is not None:
+            cache.put(file_name, key_id, offset, length, stamp, result)
+        return dict(result, cached=False)
+    except (OSError, ValueError) as e:
+        return {"path": file_name, "valid": False, "error": str(e)}
+
+
+def verify_signatures(paths, public_key, offset=None, length=None, cache=None, jobs=8):
+    key_id = get_key_id(public_key)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(
+            lambda file_name: _verify_cached(file_name, public_key, key_id, offset, length, cache),
+            asafw.iter_image_files(paths)
+        )
+    if cache is not None:
+        cache.save()
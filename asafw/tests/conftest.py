@@ -0,0 +1,35 @@
+import io
+import os
+import gzip
+import pytest
+import asafw.asafw as asafw
+
+
+@pytest.fixture
+def rootfs_data():
+    return gzip.compress(os.urandom(0x1400), mtime=0)
+
+
+@pytest.fixture
+def kernel_data():
+    return b'\x7fELF' + os.urandom(0xbbc)
+
+
+def write_image(path, rootfs_data, kernel_data, **kargs):
+    with open(path, "wb") as bin_file:
+        asafw.write_asa(bin_file, asafw.gen_blocks(
+            rootfs_block=io.BytesIO(rootfs_data),
+            kernel_block=io.BytesIO(kernel_data),
+            **kargs
+        ))
+    return path
+
+
+@pytest.fixture
+def build_image():
+    return write_image
+
+
+@pytest.fixture
+def asa_image(tmp_path, rootfs_data, kernel_data):
+    return write_image(tmp_path / "asa.bin", rootfs_data, kernel_data)
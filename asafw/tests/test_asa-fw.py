@@ -3,6 +3,9 @@ import io
 import pytest
 import asafw.asafw as asafw
 import uuid
+import gzip
+import tarfile
+import zlib
 
 raw_header_1 = b"\x11\xbb\x8dF\xd68\x01M\xa2k}fb\r\xfct`\xd0\x90\xeb\t\xf7\x1aJ\x9f0\x9eE\xf7(t\x90\x1a\x00\x00\x85\xc8b\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x01\x00\x02\x01\x01\x02\x00\x04\x00\x00\x01\x8c\x03\x00q\x04\x000CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems\x05\x00\x085AB844ED\x06\x000CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems\x07\x00\x01\x00\x08\x00\x01\x01\t\x00\x01\x00\n\x00\x01\x01\x0b\x01\x00C\x9e]3c4\xac\xb3\xdb\x84\xdcw;\x18\xe4\xde\xbdx\x0f\x12y\x8c\xfaKy\xb5\xbb\x12&\xd5'\x1c\x05\x98\x05O\xc1\x9d|\xdes\xcfT\xb3J\xce<J\x83{\x8f\xbe\x83\x1c\xcf\xbc\xfc\xd7\xb0. \xa7Z\xbb\x1fD\xab\xd3_\x98\t2%\xa8\x95\x98+\x91d\xbf\xf0\xaf\x88(\xa7\xb0\xa6<~\x10\xa18o-\xd9\xf5\x84\xd1\xc3\x85\xb3\xeb,\x90\x16\x82\xb1,G\x8a\xf2\x8e#9\x7f\xed\xef7\x93'\xbcsn\x80\xddu\xf7\x9d!\x18N\t\x19\xf4O{\x1cj\xdbb{\xd8=1\xfe\x0c\xe4\x1a?\x8bg\x1c\xc5dE.\x8d\x99\xb4\x99\x06\xa1%\xb5\x03{\x0c\xbdm\xbfl^\xc1TD\xc3&b\xc8\x8epB\xa0\t\xeeM\xa1\x05\xc45\x08<\xe7\xc3}\xa2[cWz5\xabR\xc3\xe1\x9b\xf2J\xd3\x98W\xc3\xef\xe1:\n\x81\xd3\xe5\xd7\x1a\xfdGM\x1a\xe7O\xd8\x92_\xd0\xf7*\x1c\xe2\x99\xc6\xc7]f&U\xc0{U\x91\x91\xb5\xeb\x13\xed\xfd\xcd\xa7\xd9\xb5\x0c\x00\x01A\xeb\x00\x00\x00\x00\x00\x00\x00\x00qTj\x9d\xae'\xefB\x97\x98\xc3\xdf\xbe\r\xc5^\x02\x00\x00\x81\xc8b\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00[\x0cu\x0c\x99\x0cw\x0c\x9b\x0c\xba\x0c\xbb\x0c\xae\x0c\xaf\x0c\xc1\x0c\xc2\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x81\x0e\x04\xc5.\xd1-G\x89!\xa0+\xb0\x00e5\x07\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00root=/dev/ram quiet loglevel=0 auto kstack=128 reboot=force panic=1 processor.max_cstate=1 useCiscoDma \x00\x00\x00\x00\x00\x00\x00\x00\x00\x1aM\xbfG\x90|\xfcI\x90A\xcd\xeb\xa6\xc3\xf6G\x00\x00\x00\xed\x83^\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
 raw_header_2 = b"\x11\xbb\x8dF\xd68\x01M\xa2k}fb\r\xfct`\xd0\x90\xeb\t\xf7\x1aJ\x9f0\x9eE\xf7(t\x90\x1a\x00\x00\xb6\xa1\x9d\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x01\x00\x02\x01\x01\x02\x00\x04\x00\x00\x01\x8c\x03\x00q\x04\x000CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems\x05\x00\x0860A6A3E5\x06\x000CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems\x07\x00\x01\x00\x08\x00\x01\x01\t\x00\x01\x00\n\x00\x01\x01\x0b\x01\x00\x87\x12z`\xbdx\x892\x8a`\xcf\x91\x1fGK\xd1\xf7\xb1\xe0\ta\xb8\xb7\xa7\x1d\x9fl\x80\x1b\xff\xa9\xd5s\xa7W\x97\xa5#E0\xd7\x1b\xaa\xc9\xa7\xf4\xa4\x8c\x88\xb7\xfe<\xc2@\x91Z\xfb10\xe5\xd0\xf0#e\xfd|c\x16f/\x1b/\xc5\x97\xfc[D\xdd\xc2A\xcb\xc61\xc6j\xf5-w~\\r\xd3\xd8]<\xa5{\xb1\xc9\xad\xe5=\xfb\xaa\x81NIg\xe7\xdd\x17{o\xcbdg?6t\x86\xc01:\x92\x10g\xb4L!8\x02\xd5\x04\x88\xa2\x81&\n\x9c\xde\xf9\x03m=A\r\x07\x11\x17X\x92\xd6\xaex\xd6\xe1\x11\xb3\xe1\xb1m\xa5\xf8\xc8\xa7\\\x7fl\x97\xa3\xd3Yu|\xcaU\xb7\x7f:\xe2\x82N7P\xa2\x96\xff\x03?\xc5\xf5\xcd|\x90\xf4m\xc67\xf0\xd7\xfeq[!\xd4\x1c\xa4\xf0\xbd\x81f\x9eJ>\x83\xf5%}\x8eX\xea\xcf\xd4\x88\xc5\xa5}F\x9a\xbd2\xf1\xbbA\xd0\xc7\x18a\x94\x9b\x96\x0bh\x14L\xa9u\xe5\x19\xfa\x96d\x1f\x01\xee\xbd\x0c\x00\x01A\xeb\x00\x00\x00\x00\x00\x00\x00\x00qTj\x9d\xae'\xefB\x97\x98\xc3\xdf\xbe\r\xc5^\x02\x00\x00\xb2\xa1\x9d\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00[\x0cu\x0c\x99\x0cw\x0c\x9b\x0c\xba\x0c\xbb\x0c\xae\x0c\xaf\x0c\xc1\x0c\xc2\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x81\x0e\x04\xc5.\xd1-G\x89!\xa0+\xb0\x00e5\x07\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00root=/dev/ram quiet loglevel=0 auto kstack=128 reboot=force panic=1 processor.max_cstate=1 useCiscoDma \x00\x00\x00\x00\x00\x00\x00\x00\x00\x1aM\xbfG\x90|\xfcI\x90A\xcd\xeb\xa6\xc3\xf6G\x00\x00\x00\xef\xa7\x91\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
@@ -135,4 +138,329 @@ def test_write_asa():
         kernel_block=io.BytesIO(bytearray(b'\x00') * 0x444870)
     ))
     output_bytes = bin_file.getvalue()
-    assert(raw_header_1[:0x2c0] == output_bytes[:0x2c0])
\ No newline at end of file
+    assert(raw_header_1[:0x2c0] == output_bytes[:0x2c0])
+
+def test_block_index(asa_image, rootfs_data):
+    with open(asa_image, "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            assert(index.offset == 0x10)
+            assert(index.root.UUID == asafw.UUID_MAIN_CONTAINER)
+            assert(index.root.data_range[1] == os.path.getsize(asa_image))
+
+            rootfs = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0]
+            assert(rootfs.path == (asafw.UUID_MAIN_CONTAINER, asafw.UUID_FW_CONTAINER, asafw.UUID_ROOTFS_FW_BLOCK))
+            assert(isinstance(rootfs.data, memoryview))
+            assert(bytes(rootfs.data[:len(rootfs_data)]) == rootfs_data)
+
+            kernel_params = index.find(asafw.UUID_KERNEL_PARAMS)[0]
+            assert(bytes(kernel_params.meta_data).startswith(b'root=/dev/ram'))
+            assert(len(kernel_params.data) == 0)
+
+def test_block_index_matches_parser(asa_image):
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        expected = io.StringIO()
+        asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, "/nonexistent"), expected)
+
+        with asafw.AsaBlockIndex(bin_file) as index:
+            output = io.StringIO()
+            asafw.pprint_tree(asafw.get_blocks_from_index(index.root), output)
+            assert(index.root.header.DataLength == index.root.data_range[1] - index.root.data_range[0])
+
+    assert(output.getvalue() == expected.getvalue())
+
+def test_iter_blocks_matches_index(asa_image):
+    with open(asa_image, "rb") as bin_file:
+        events = list(asafw.iter_blocks(bin_file))
+        with asafw.AsaBlockIndex(bin_file) as index:
+            expected = [
+                (len(entry.path) - 1, entry.path, entry.header.pack(), entry.meta_range, entry.data_range)
+                for entry in index.walk()
+            ]
+    assert([(depth, path, header.pack(), meta_range, data_range)
+            for depth, path, header, meta_range, data_range in events] == expected)
+
+def test_iter_blocks_deep_nesting():
+    # Deeper than the recursion limit, which the recursive parsers could not handle
+    depth = 3000
+    image = asafw.AsaBlockHeader(UUID=asafw.UUID_ROOTFS_FW_BLOCK, DataLength=0x10).pack() + bytes(0x10)
+    for _ in range(depth):
+        image = asafw.AsaBlockHeader(UUID=asafw.UUID_FW_CONTAINER, HasSubBlocks=True, DataLength=len(image)).pack() + image
+
+    events = list(asafw.iter_blocks(io.BytesIO(image)))
+    assert(len(events) == depth + 1)
+    assert(events[-1][0] == depth)
+    assert(events[-1][4] == (len(image) - 0x10, len(image)))
+
+    with asafw.AsaBlockIndex(io.BytesIO(image)) as index:
+        assert(len(list(index.walk())) == depth + 1)
+        output = io.StringIO()
+        asafw.pprint_tree(index.root, output)
+        assert(output.getvalue().count("\n") == depth + 1)
+
+def test_block_index_truncated(asa_image):
+    with open(asa_image, "rb") as bin_file:
+        truncated = io.BytesIO(bin_file.read(0x400))
+    with pytest.raises(ValueError):
+        asafw.AsaBlockIndex(truncated)
+
+def test_extract_single_pass(asa_image, tmp_path, rootfs_data, kernel_data):
+    output_dir = tmp_path / "out"
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        top_block = asafw.get_blocks_from_file(bin_file, str(output_dir), True)
+
+    fw_dir = output_dir / str(asafw.UUID_MAIN_CONTAINER) / str(asafw.UUID_FW_CONTAINER)
+    rootfs_dir = fw_dir / str(asafw.UUID_ROOTFS_FW_BLOCK)
+    assert((rootfs_dir / "block").read_bytes()[:len(rootfs_data)] == rootfs_data)
+    assert((rootfs_dir / "block.bin").read_bytes() == gzip.decompress(rootfs_data))
+
+    boot_dir = fw_dir / str(asafw.UUID_BOOT_FW_BLOCK)
+    elf_dir = boot_dir / str(asafw.UUID_BOOT_FW_ELF_BLOCK)
+    assert((elf_dir / "block").read_bytes() == kernel_data)
+    assert(not (elf_dir / "block.bin").exists())
+
+    boot_block = top_block.data[0].data[2]
+    assert(boot_block.asa_block_header.HasSubBlocks)
+    assert(boot_block.data[0].asa_block_header.UUID == asafw.UUID_BOOT_FW_ELF_BLOCK)
+
+def test_dump_block_corrupt_gzip(tmp_path):
+    header = asafw.asa_block(UUID=asafw.UUID_ROOTFS_FW_BLOCK)
+    payload = gzip.compress(os.urandom(0x100), mtime=0)
+    payload = payload[:0x20] + bytes(len(payload) - 0x20)
+    header.DataLength = asafw.get_boundary_aligned_length(len(payload))
+    with pytest.raises(zlib.error):
+        asafw.dump_block(io.BytesIO(payload.ljust(header.DataLength, b'\x00')), header, str(tmp_path))
+
+def test_extract_parallel_matches_sequential(asa_image, tmp_path):
+    output_dir = str(tmp_path / "out")
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        expected = io.StringIO()
+        asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, output_dir, True), expected)
+
+    output = io.StringIO()
+    asafw.pprint_tree(asafw.get_blocks_from_file_parallel(str(asa_image), output_dir, 2), output)
+    assert(output.getvalue() == expected.getvalue())
+
+def test_extract_tar_matches_directory(asa_image, tmp_path):
+    output_dir = str(tmp_path / "out")
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        expected = io.StringIO()
+        asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, output_dir, True), expected)
+
+    tar_stream = io.BytesIO()
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        target = asafw.TarDumpTarget(tar_stream, output_dir)
+        output = io.StringIO()
+        asafw.pprint_tree(asafw.get_blocks_from_file(bin_file, output_dir, True, target=target), output)
+        target.close()
+    assert(output.getvalue() == expected.getvalue())
+
+    tar_stream.seek(0)
+    with tarfile.open(fileobj=tar_stream) as tar:
+        members = tar.getmembers()
+        for member in members:
+            path = os.path.join(output_dir, member.name)
+            if member.isdir():
+                assert(os.path.isdir(path))
+            else:
+                assert(tar.extractfile(member).read() == open(path, "rb").read())
+    files = [os.path.join(root, name) for root, dirs, names in os.walk(output_dir) for name in names]
+    assert(len([member for member in members if member.isfile()]) == len(files))
+
+def test_extract_tar_error_not_masked(asa_image, tmp_path):
+    with open(asa_image, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        data_range = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0].data_range
+    # Cut the image half way through the gzip rootfs, while its tar member is being streamed
+    asa_image.write_bytes(asa_image.read_bytes()[:(data_range[0] + data_range[1]) // 2])
+    with open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        target = asafw.TarDumpTarget(io.BytesIO(), str(tmp_path))
+        with pytest.raises(EOFError):
+            asafw.get_blocks_from_file(bin_file, str(tmp_path), True, target=target)
+    assert(target.streaming is None)
+
+def test_gen_blocks_boot_block_streamed(kernel_data):
+    kernel_container = io.BytesIO()
+    asafw.write_block(kernel_container, asafw.AsaBlock(
+        asafw.asa_block(UUID=asafw.UUID_BOOT_FW_ELF_BLOCK), None, kernel_data))
+
+    top_block = asafw.gen_blocks(rootfs_block=io.BytesIO(b'rootfs'), kernel_block=io.BytesIO(kernel_data))
+    boot_block = top_block.data[0].data[2]
+    boot_block.data.seek(0, io.SEEK_SET)
+    assert(boot_block.data.read() == gzip.compress(kernel_container.getvalue(), mtime=0))
+
+def test_write_block_back_patches_stream_length():
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'\xaa' * 1000)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as rootfs_stream:
+        fw_block = asafw.AsaBlock(
+            asafw.asa_block(UUID=asafw.UUID_FW_CONTAINER, HasSubBlocks=True),
+            meta_data=None,
+            data=[asafw.AsaBlock(asafw.asa_block(UUID=asafw.UUID_ROOTFS_FW_BLOCK), None, rootfs_stream)]
+        )
+        assert(fw_block.asa_block_header.DataLength == asafw.asa_block.size)
+
+        bin_file = io.BytesIO()
+        asafw.write_block(bin_file, fw_block)
+
+    bin_file.seek(0, os.SEEK_SET)
+    fw_header, _ = asafw.parse_block(bin_file)
+    rootfs_header, _ = asafw.parse_block(bin_file)
+    assert(rootfs_header.DataLength == 0x3f0)
+    assert(fw_header.DataLength == asafw.asa_block.size + 0x3f0)
+    assert(len(bin_file.getvalue()) == 2 * asafw.asa_block.size + 0x3f0)
+
+def test_block_manifest(asa_image, tmp_path, rootfs_data):
+    with open(asa_image, "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            expected = asafw.get_index_manifest(index)
+
+        bin_file.seek(0, os.SEEK_SET)
+        asafw.check_for_asa_fw_blob(bin_file)
+        manifest = {}
+        asafw.get_blocks_from_file(bin_file, str(tmp_path), True, manifest)
+
+    assert(manifest == expected)
+    rootfs_key = "/".join(str(block_uuid) for block_uuid in
+        (asafw.UUID_MAIN_CONTAINER, asafw.UUID_FW_CONTAINER, asafw.UUID_ROOTFS_FW_BLOCK))
+    rootfs_payload = rootfs_data.ljust(asafw.get_boundary_aligned_length(len(rootfs_data)), b'\x00')
+    assert(manifest[rootfs_key]["sha256"] == asafw.SHA256.new(rootfs_payload).hexdigest())
+    assert(manifest[rootfs_key]["length"] == len(rootfs_payload))
+
+def test_write_asa_manifest(asa_image, rootfs_data, kernel_data):
+    manifest = {}
+    bin_file = io.BytesIO()
+    asafw.write_asa(bin_file, asafw.gen_blocks(
+        rootfs_block=io.BytesIO(rootfs_data),
+        kernel_block=io.BytesIO(kernel_data)
+    ), manifest)
+    assert(bin_file.getvalue() == asa_image.read_bytes())
+
+    with asafw.AsaBlockIndex(bin_file) as index:
+        assert(manifest == asafw.get_index_manifest(index))
+
+def test_write_asa_manifest_stream(asa_image, rootfs_data, kernel_data):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, rootfs_data)
+    os.close(write_fd)
+    manifest = {}
+    bin_file = io.BytesIO()
+    with os.fdopen(read_fd, 'rb') as rootfs_stream:
+        asafw.write_asa(bin_file, asafw.gen_blocks(
+            rootfs_block=rootfs_stream,
+            kernel_block=io.BytesIO(kernel_data)
+        ), manifest)
+    assert(bin_file.getvalue() == asa_image.read_bytes())
+
+    with asafw.AsaBlockIndex(bin_file) as index:
+        assert(manifest == asafw.get_index_manifest(index))
+
+def test_get_hash():
+    bin_file = io.BytesIO(b'\x00' * 0x10 + b'data' * 0x100)
+    bin_file.seek(0x10, os.SEEK_SET)
+    assert(asafw.get_hash(bin_file, 0x400) == asafw.SHA512.new(b'data' * 0x100).hexdigest())
+    assert(bin_file.tell() == 0x10)
+
+def test_get_image_info(asa_image):
+    info = asafw.get_image_info(str(asa_image))
+    assert(info["serial"] == "5AB844ED")
+    assert(info["issuer"] == "CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems")
+    assert(info["kernel_options"].startswith("root=/dev/ram quiet"))
+    assert([block["path"].split("/")[-1] for block in info["blocks"]] == [
+        str(block_uuid) for block_uuid in (
+            asafw.UUID_MAIN_CONTAINER, asafw.UUID_FW_CONTAINER, asafw.UUID_KERNEL_PARAMS,
+            asafw.UUID_ROOTFS_FW_BLOCK, asafw.UUID_BOOT_FW_BLOCK)])
+
+def test_get_images_info_directory(asa_image, tmp_path):
+    (tmp_path / "corrupt.bin").write_bytes(asa_image.read_bytes()[:0x100])
+    results = list(asafw.get_images_info([str(tmp_path)], jobs=2))
+    assert([os.path.basename(info["path"]) for info in results] == ["asa.bin", "corrupt.bin"])
+    assert(results[0]["serial"] == "5AB844ED")
+    assert("error" in results[1])
+
+def test_fast_block_header():
+    header = asafw.AsaBlockHeader.unpack_from(raw_header_1, 0x10)
+    reference = asafw.asa_block(raw_header_1[0x10:0x30])
+    assert(header.UUID == reference.UUID)
+    assert(header.MetaDataLength == reference.MetaDataLength == 0x1a0)
+    assert(header.DataLength == reference.DataLength == 0x62c8850)
+    assert(header.HasSubBlocks == reference.HasSubBlocks)
+    assert(header.pack() == reference.pack() == raw_header_1[0x10:0x30])
+
+    built = asafw.AsaBlockHeader(UUID=asafw.UUID_MAIN_CONTAINER, HasSubBlocks=True, MetaDataLength=0x1a0, DataLength=0x62c8850)
+    output = bytearray(0x40)
+    built.pack_into(output, 0x10)
+    assert(bytes(output[0x10:0x30]) == raw_header_1[0x10:0x30])
+
+    built.UUID = str(asafw.UUID_KERNEL_PARAMS)
+    assert(built.UUID == asafw.UUID_KERNEL_PARAMS)
+
+def test_bench_header_codec():
+    import asafw.bench as bench
+    results = bench.bench_header_codec(100)
+    assert(results["decode_struct"]["headers"] == 100)
+    assert(results["decode_speedup"] > 0)
+
+def test_copy_file(tmp_path):
+    data = os.urandom(0x12345)
+    src_path = tmp_path / "src"
+    src_path.write_bytes(data)
+    with open(src_path, "rb") as src_file, open(tmp_path / "dst", "wb") as dst_file:
+        src_file.read(0x10)
+        dst_file.write(b'x')
+        assert(asafw.copy_file(src_file, dst_file, 0x1000) == 0x1000)
+        assert(src_file.tell() == 0x1010 and dst_file.tell() == 0x1001)
+        assert(asafw.copy_file(src_file, dst_file) == len(data) - 0x1010)
+        dst_file.write(b'y')
+    assert((tmp_path / "dst").read_bytes() == b'x' + data[0x10:] + b'y')
+
+    # Streams without a file descriptor go through a bounded buffer
+    output = io.BytesIO()
+    assert(asafw.copy_file(io.BytesIO(data), output, 0x20000) == 0x12345)
+    assert(output.getvalue() == data)
+
+def test_extract_stored_payload(tmp_path, kernel_data):
+    rootfs_path = tmp_path / "rootfs"
+    rootfs_path.write_bytes(os.urandom(0x2345))
+    image_path = tmp_path / "asa.bin"
+    with open(image_path, "wb") as bin_file, open(rootfs_path, "rb") as rootfs_file:
+        asafw.write_asa(bin_file, asafw.gen_blocks(rootfs_block=rootfs_file, kernel_block=io.BytesIO(kernel_data)))
+    with open(image_path, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        asafw.get_blocks_from_file(bin_file, str(tmp_path / "out"), True)
+    block_path = tmp_path / "out" / str(asafw.UUID_MAIN_CONTAINER) / str(asafw.UUID_FW_CONTAINER) / str(asafw.UUID_ROOTFS_FW_BLOCK) / "block"
+    assert(block_path.read_bytes() == rootfs_path.read_bytes() + bytes(0xb))
+
+def test_match_block_path():
+    path = (asafw.UUID_MAIN_CONTAINER, asafw.UUID_FW_CONTAINER, asafw.UUID_ROOTFS_FW_BLOCK)
+    assert(asafw.match_block_path(path, None))
+    assert(asafw.match_block_path(path, [str(asafw.UUID_ROOTFS_FW_BLOCK).upper()]))
+    assert(asafw.match_block_path(path, ["1a4dbf47-*"]))
+    assert(asafw.match_block_path(path, [str(asafw.UUID_FW_CONTAINER)]))
+    assert(asafw.match_block_path(path, [f"/*/{asafw.UUID_FW_CONTAINER}/*"]))
+    assert(not asafw.match_block_path(path, [str(asafw.UUID_BOOT_FW_BLOCK), f"{asafw.UUID_FW_CONTAINER}/*"]))
+    assert(asafw.is_block_selected(path[:2] + (asafw.UUID_BOOT_FW_BLOCK,), [str(asafw.UUID_BOOT_FW_ELF_BLOCK)]))
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_extract_only(asa_image, tmp_path, rootfs_data, jobs):
+    output_dir = tmp_path / "out"
+    only = [str(asafw.UUID_BOOT_FW_ELF_BLOCK)]
+    if jobs > 1:
+        top_block = asafw.get_blocks_from_file_parallel(str(asa_image), str(output_dir), jobs, only=only)
+    else:
+        with open(asa_image, "rb") as bin_file:
+            asafw.check_for_asa_fw_blob(bin_file)
+            top_block = asafw.get_blocks_from_file(bin_file, str(output_dir), True, only=only)
+
+    fw_dir = output_dir / str(asafw.UUID_MAIN_CONTAINER) / str(asafw.UUID_FW_CONTAINER)
+    assert(os.listdir(fw_dir) == [str(asafw.UUID_BOOT_FW_BLOCK)])
+    assert((fw_dir / str(asafw.UUID_BOOT_FW_BLOCK) / str(asafw.UUID_BOOT_FW_ELF_BLOCK) / "block").exists())
+    output = io.StringIO()
+    asafw.pprint_tree(top_block, output)
+    # Blocks left out are listed like --display-only does
+    assert(f"DATA BLOCK [{hex(asafw.get_boundary_aligned_length(len(rootfs_data)))}]\n" in output.getvalue())
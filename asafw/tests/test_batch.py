@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import pytest
+import asafw.batch as batch
+
+
+def test_load_variants():
+    variants_file = io.StringIO("output,serial,magic_key,kernel_options\na.bin,11111111,0102,\nb.bin,,,quiet\n")
+    variants_file.name = "variants.csv"
+    assert(batch.load_variants(variants_file) == [
+        ("a.bin", {"serial": "11111111", "magic_key": b'\x01\x02'}),
+        ("b.bin", {"kernel_options": "quiet"}),
+    ])
+
+    variants_file = io.StringIO(json.dumps([{"output": "a.bin", "serial": "22222222"}]))
+    variants_file.name = "variants.json"
+    assert(batch.load_variants(variants_file) == [("a.bin", {"serial": "22222222"})])
+
+    with pytest.raises(ValueError):
+        batch.parse_variant({"output": "a.bin", "serial_number": "1"})
+    with pytest.raises(ValueError):
+        batch.parse_variant({"serial": "1"})
+
+def test_build_images(tmp_path, rootfs_data, kernel_data, build_image):
+    (tmp_path / "rootfs").write_bytes(rootfs_data)
+    (tmp_path / "kernel").write_bytes(kernel_data)
+    magic_key = os.urandom(0x100)
+    variants = [
+        ("a.bin", {"serial": "11111111", "magic_key": magic_key}),
+        ("b.bin", {"kernel_options": "root=/dev/ram console=ttyS0,9600 " * 3}),
+        ("c.bin", {}),
+    ]
+    results = list(batch.build_images(variants, str(tmp_path / "kernel"), str(tmp_path / "rootfs"), str(tmp_path / "images"), jobs=2))
+    assert([os.path.basename(result["output"]) for result in results] == ["a.bin", "b.bin", "c.bin"])
+    for (output_path, kargs), result in zip(variants, results):
+        expected = build_image(tmp_path / "expected.bin", rootfs_data, kernel_data, **kargs).read_bytes()
+        assert((tmp_path / "images" / output_path).read_bytes() == expected)
+        assert(result["size"] == len(expected))
+    assert(sorted(os.listdir(tmp_path / "images")) == ["a.bin", "b.bin", "c.bin"])
+
+def test_build_images_duplicate_output(tmp_path):
+    with pytest.raises(ValueError):
+        list(batch.build_images([("a.bin", {}), ("./a.bin", {})], "kernel", "rootfs", str(tmp_path)))
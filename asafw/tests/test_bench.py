@@ -0,0 +1,41 @@
+import io
+import json
+import asafw.asafw as asafw
+import asafw.bench as bench
+import asafw.util as util
+
+
+def test_parse_size():
+    assert(util.parse_size("10M") == 10 << 20)
+    assert(util.parse_size("2G") == 2 << 30)
+    assert(util.parse_size("0x400") == 0x400)
+
+def test_synthetic_image(tmp_path):
+    rootfs_path, kernel_path = bench.gen_synthetic_inputs(str(tmp_path), 0x10000, compressible=False)
+    image_size = bench.gen_synthetic_image(str(tmp_path / "image.bin"), rootfs_path, kernel_path)
+
+    with open(tmp_path / "image.bin", "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            assert(index.root.data_range[1] == image_size)
+            rootfs = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0]
+            assert(rootfs.header.DataLength == 0x10000)
+
+def test_run_suite_results_format(tmp_path):
+    results = bench.run_suite([0x8000], ("compressible", "random"), isolate=False, work_dir=str(tmp_path))
+    assert(results["schema"] == bench.RESULTS_SCHEMA)
+    assert(len(results["results"]) == 2 * len(bench.BENCHMARKS))
+    for result in results["results"]:
+        assert(result["seconds"] > 0)
+        assert(result["peak_rss_kb"] > 0)
+
+    output = io.StringIO()
+    bench.write_results(results, output)
+    assert(json.loads(output.getvalue()) == results)
+
+    comparison = bench.compare_results(results, results)
+    assert(len(comparison) == len(results["results"]))
+    assert(not any(row["regression"] for row in comparison))
+
+def test_format_ratio():
+    assert(bench.format_ratio(1.23456) == "x1.235")
+    assert(bench.format_ratio(None) == "n/a")
@@ -0,0 +1,69 @@
+import os
+import asafw.asafw as asafw
+import asafw.cache as cache
+
+
+def extract(image_path, output_dir, extract_cache=None):
+    with open(image_path, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        return str(asafw.get_blocks_from_file(bin_file, str(output_dir), True, cache=extract_cache))
+
+def read_tree(directory):
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, directory)] = open(path, "rb").read()
+    return files
+
+def test_cache_hit_matches_extract(asa_image, tmp_path):
+    expected = extract(asa_image, tmp_path / "plain")
+    extract_cache = cache.ExtractCache(str(tmp_path / "cache"))
+
+    first = extract(asa_image, tmp_path / "plain", extract_cache)
+    assert(first == expected)
+    entries = list(extract_cache.entries())
+    assert(len(entries) == 2)
+
+    os.rename(tmp_path / "plain", tmp_path / "expected")
+    second = extract(asa_image, tmp_path / "plain", extract_cache)
+    assert(second == expected)
+    assert(len(list(extract_cache.entries())) == 2)
+    assert(read_tree(tmp_path / "plain") == read_tree(tmp_path / "expected"))
+
+def test_cache_copies_files(asa_image, tmp_path):
+    extract_cache = cache.ExtractCache(str(tmp_path / "cache"))
+    extract(asa_image, tmp_path / "out", extract_cache)
+
+    rootfs = tmp_path / "out" / str(asafw.UUID_MAIN_CONTAINER) / str(asafw.UUID_FW_CONTAINER) / str(asafw.UUID_ROOTFS_FW_BLOCK) / "block.bin"
+    cached = [
+        os.path.join(root, "block.bin")
+        for root, dirs, names in os.walk(tmp_path / "cache")
+        if root.endswith(str(asafw.UUID_ROOTFS_FW_BLOCK))
+    ]
+    assert(len(cached) == 1)
+    assert(rootfs.read_bytes() == open(cached[0], "rb").read())
+    # Editing the extracted tree must leave the cache intact
+    assert(not os.path.samefile(rootfs, cached[0]))
+    expected = rootfs.read_bytes()
+    with open(rootfs, "r+b") as rootfs_file:
+        rootfs_file.write(b'\xff' * 0x10)
+    assert(open(cached[0], "rb").read() == expected)
+
+def test_cache_parallel_extract(asa_image, tmp_path):
+    expected = extract(asa_image, tmp_path / "plain")
+    extract_cache = cache.ExtractCache(str(tmp_path / "cache"))
+
+    output_dir = str(tmp_path / "parallel")
+    blocks = asafw.get_blocks_from_file_parallel(str(asa_image), output_dir, 2, cache=extract_cache)
+    assert(str(blocks).replace(output_dir, str(tmp_path / "plain")) == expected)
+    assert(read_tree(tmp_path / "parallel") == read_tree(tmp_path / "plain"))
+
+def test_cache_eviction(asa_image, tmp_path):
+    extract_cache = cache.ExtractCache(str(tmp_path / "cache"), max_bytes=1)
+    extract(asa_image, tmp_path / "out", extract_cache)
+
+    # Only the most recently stored block survives a budget too small for any of them
+    entries = list(extract_cache.entries())
+    assert(len(entries) == 1)
+    assert(os.path.exists(tmp_path / "out" / str(asafw.UUID_MAIN_CONTAINER) / str(asafw.UUID_FW_CONTAINER) / str(asafw.UUID_ROOTFS_FW_BLOCK) / "block.bin"))
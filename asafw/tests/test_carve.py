@@ -0,0 +1,50 @@
+import os
+import pytest
+import asafw.asafw as asafw
+import asafw.carve as carve
+
+
+@pytest.fixture
+def dump(asa_image, tmp_path):
+    image = asa_image.read_bytes()
+    parts = [
+        os.urandom(0x1235),
+        image,
+        os.urandom(0x777),
+        # A bare main container, as left behind when the blob prefix is overwritten
+        image[0x10:],
+        b'\x00' * 0x40,
+        # A signature without a valid image behind it
+        asafw.UUID_ASA_FW_BLOB.bytes + os.urandom(0x100),
+    ]
+    dump_path = tmp_path / "dump.bin"
+    dump_path.write_bytes(b''.join(parts))
+    offsets = [0x1235, 0x1235 + len(image) + 0x777]
+    return dump_path, image, offsets, offsets[1] + len(image) - 0x10 + 0x40
+
+def test_scan_file_chunk_edges(dump):
+    dump_path, image, offsets, bad_offset = dump
+    expected = carve.scan_file(str(dump_path), jobs=1)
+    assert((offsets[0], "blob") in expected and (offsets[1], "container") in expected)
+    # Chunks small enough that signatures straddle their edges
+    for chunk_size in (0x100, 0x107, 0x1238):
+        assert(carve.scan_file(str(dump_path), jobs=1, chunk_size=chunk_size) == expected)
+    assert(carve.scan_file(str(dump_path), jobs=2, chunk_size=0x1000) == expected)
+
+def test_carve(dump, tmp_path):
+    dump_path, image, offsets, bad_offset = dump
+    results = list(carve.carve(str(dump_path), str(tmp_path / "out"), jobs=1))
+    assert([(result["offset"], result["kind"], result["size"]) for result in results] == [
+        (offsets[0], "blob", len(image)),
+        (offsets[1], "container", len(image) - 0x10),
+    ])
+    assert(all(result["valid"] and not result["warnings"] for result in results))
+    assert(open(results[0]["output"], "rb").read() == image)
+    assert(open(results[1]["output"], "rb").read() == image[0x10:])
+
+def test_carve_invalid(dump):
+    dump_path, image, offsets, bad_offset = dump
+    results = list(carve.carve(str(dump_path), jobs=1, include_invalid=True))
+    assert(results[-1]["offset"] == bad_offset)
+    assert(not results[-1]["valid"] and results[-1]["errors"])
+    assert(len([result for result in results if result["valid"]]) == 2)
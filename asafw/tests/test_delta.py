@@ -0,0 +1,42 @@
+import os
+import pytest
+import asafw.delta as delta
+
+
+def diff_and_apply(old_path, new_path, tmp_path):
+    with open(old_path, "rb") as old_file, open(new_path, "rb") as new_file, \
+            open(tmp_path / "delta.bin", "wb") as delta_file:
+        stats = delta.diff_images(old_file, new_file, delta_file)
+    with open(old_path, "rb") as old_file, open(tmp_path / "delta.bin", "rb") as delta_file, \
+            open(tmp_path / "rebuilt.bin", "w+b") as output_file:
+        delta.apply_delta(old_file, delta_file, output_file)
+    assert((tmp_path / "rebuilt.bin").read_bytes() == new_path.read_bytes())
+    return stats
+
+def test_delta_identical(asa_image, tmp_path):
+    stats = diff_and_apply(asa_image, asa_image, tmp_path)
+    assert(stats["literal"] == 0)
+    assert(stats["copied"] == os.path.getsize(asa_image))
+
+def test_delta_metadata_only(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    new_image = build_image(tmp_path / "new.bin", rootfs_data, kernel_data,
+                            kernel_options="root=/dev/ram quiet", serial="JAD1234567")
+    stats = diff_and_apply(asa_image, new_image, tmp_path)
+    # Only headers and metadata changed, every payload is copied from the old image
+    assert(stats["literal"] < 0x400)
+
+def test_delta_shifted_payload(tmp_path, kernel_data, build_image):
+    rootfs_data = os.urandom(0x40000)
+    old_image = build_image(tmp_path / "old.bin", rootfs_data, kernel_data)
+    new_rootfs = rootfs_data[:0x1000] + b"inserted" + rootfs_data[0x1000:0x30000] + os.urandom(0x100) + rootfs_data[0x30100:]
+    new_image = build_image(tmp_path / "new.bin", new_rootfs, kernel_data)
+    stats = diff_and_apply(old_image, new_image, tmp_path)
+    assert(stats["literal"] < 0x8000)
+
+def test_delta_wrong_image(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    new_image = build_image(tmp_path / "new.bin", rootfs_data, kernel_data, kernel_options="quiet")
+    diff_and_apply(asa_image, new_image, tmp_path)
+    with open(new_image, "rb") as old_file, open(tmp_path / "delta.bin", "rb") as delta_file, \
+            open(tmp_path / "wrong.bin", "w+b") as output_file:
+        with pytest.raises(ValueError):
+            delta.apply_delta(old_file, delta_file, output_file)
@@ -0,0 +1,64 @@
+import io
+import os
+import pytest
+import asafw.asafw as asafw
+import asafw.field1 as field1
+
+
+def test_round_trip():
+    raw = asafw.gen_asa_raw_field1_headers(serial="12345678", magic_key=os.urandom(0x100))
+    padded = raw + bytes(8)
+    fields, length = field1.decode(padded)
+    assert(length == len(raw))
+    assert([item.field for item in fields] == list(range(1, 4)) + list(range(7, 13)))
+    assert([item.field for item in fields[2].data] == [4, 5, 6])
+    assert(field1.encode(fields) == raw)
+    # Data is sliced from the input, not copied
+    assert(isinstance(fields[3].data, memoryview) and fields[3].data.obj is padded)
+
+def test_parse_field1_headers_compatible():
+    raw = asafw.gen_asa_raw_field1_headers()
+    bin_file = io.BytesIO(raw + bytes(8))
+    headers = asafw.parse_field1_headers(bin_file)
+    assert(bin_file.tell() == len(raw))
+    assert(bytes(asafw.find_field1(headers, 5).data) == b"60A6A3E5")
+    assert(str(headers[2]) == str(asafw.asa_field1(field=3, length=113, data=[
+        asafw.asa_field1(field=4, length=48, data=b'CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems'),
+        asafw.asa_field1(field=5, length=8, data=b'60A6A3E5'),
+        asafw.asa_field1(field=6, length=48, data=b'CN=CiscoSystems;OU=NCS_Kenton_ASA;O=CiscoSystems')])))
+    assert(b''.join(header.pack() for header in headers) + b'\xeb' == raw)
+
+def test_large_and_nested():
+    leaves = [field1.Field1(index % 100 + 100, os.urandom(index % 50)) for index in range(2000)]
+    nested = field1.Field1(20, [field1.Field1(21, b'x')])
+    for _ in range(3000):
+        nested = field1.Field1(20, [nested])
+    schema = {}
+    schema[20] = schema
+    raw = field1.encode(leaves[:1000] + [field1.Field1(3, leaves[1000:1100])] + [nested])
+    fields, length = field1.decode(raw, {3: {}, **schema})
+    assert(length == len(raw))
+    assert(len(fields) == 1002 and len(fields[1000].data) == 100)
+    assert(field1.encode(fields) == raw)
+
+def test_errors():
+    with pytest.raises(ValueError):
+        field1.decode(b'\x01\x00\x05abc')
+    with pytest.raises(ValueError):
+        field1.decode(b'\x03\x00\x04\x04\x00\x05abcdef', field1.MAIN_CONTAINER_SCHEMA)
+    with pytest.raises(ValueError):
+        field1.encode([field1.Field1(1, bytes(0x10000))])
+    with pytest.raises(ValueError):
+        field1.encode([field1.Field1(3, [field1.Field1(4, bytes(0xfffd))])])
+
+def test_parse_field1_headers_bounded_read(tmp_path):
+    raw = asafw.gen_asa_raw_field1_headers()
+    (tmp_path / "meta.bin").write_bytes(b'\x00' * 4 + raw + b'\x01' * 0x10000)
+    with open(tmp_path / "meta.bin", "rb") as bin_file:
+        bin_file.seek(4)
+        headers = asafw.parse_field1_headers(bin_file, len(raw))
+        assert(bin_file.tell() == 4 + len(raw))
+        assert(len(headers) == 9)
+        bin_file.seek(4)
+        # Without a length, no more than a block header's metadata is read
+        assert(len(asafw.parse_field1_headers(bin_file)) == 9)
@@ -0,0 +1,38 @@
+import os
+import gzip
+import pytest
+import asafw.asafw as asafw
+import asafw.gzindex as gzindex
+
+
+@pytest.fixture
+def payload():
+    return (b'\x7fELF' + os.urandom(0x4000)) * 8 + b'kernel' * 0x4000
+
+def test_gzip_index_random_reads(payload):
+    index = gzindex.GzipIndex(memoryview(gzip.compress(payload) + bytes(0x10)), span=0x2000)
+    for offset, length in ((0x30000, 0x100), (0, 0x20), (0x1fff, 0x4002), (len(payload) - 0x10, 0x100)):
+        assert(index.read(offset, length) == payload[offset:offset + length])
+    assert(len(index) == len(payload))
+    assert(len(index.points) > 10)
+    assert(all(point.out_offset < len(payload) for point in index.points))
+    assert(index.read(len(payload), 0x10) == b'')
+
+def test_gzip_index_lazy(payload):
+    index = gzindex.GzipIndex(memoryview(gzip.compress(payload)), span=0x2000)
+    assert(index.read(0, 4) == b'\x7fELF')
+    # Reading the start only inflates up to the first access point
+    assert(len(index.points) <= 2)
+    assert(index.size is None)
+
+def test_gzip_index_truncated(payload):
+    index = gzindex.GzipIndex(memoryview(gzip.compress(payload)[:0x1000]))
+    with pytest.raises(EOFError):
+        index.build()
+
+def test_boot_info(asa_image, kernel_data):
+    info = asafw.get_boot_info(str(asa_image))
+    assert(info["uuid"] == str(asafw.UUID_BOOT_FW_ELF_BLOCK))
+    assert(info["data_length"] == asafw.get_boundary_aligned_length(len(kernel_data)))
+    assert("elf" in info)
+    assert(asafw.read_boot_block(str(asa_image), info["data_offset"] + 0x10, 0x100) == kernel_data[0x10:0x110])
@@ -0,0 +1,40 @@
+import hashlib
+import pytest
+import asafw.asafw as asafw
+import asafw.hashsearch as hashsearch
+
+
+def test_search_structural_range(asa_image):
+    data = asa_image.read_bytes()
+    with open(asa_image, "rb") as bin_file:
+        with asafw.AsaBlockIndex(bin_file) as index:
+            rootfs = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0]
+            start, end = rootfs.data_range
+
+    target = hashlib.sha512(data[start:end]).hexdigest()
+    matches = hashsearch.search_hashes(str(asa_image), [target], structural_only=True)
+    assert(matches == [("sha512", start, end, target)])
+
+def test_search_unaligned_suffix(asa_image):
+    data = asa_image.read_bytes()
+    targets = [hashlib.md5(data[0x123:]).hexdigest(), hashlib.sha256(data[0x40:]).hexdigest()]
+    progress = []
+    matches = hashsearch.search_hashes(str(asa_image), targets, start_range=(0, 0x200),
+                                       progress=lambda searched, total, found: progress.append(searched))
+    assert(sorted(match[1] for match in matches) == [0x40, 0x123])
+    assert(progress[-1] < 0x200)
+
+def test_search_parallel(asa_image):
+    data = asa_image.read_bytes()
+    target = hashlib.sha512(data[0x81:]).hexdigest()
+    matches = hashsearch.search_hashes(str(asa_image), [target], jobs=2, start_range=(0, 0x100))
+    assert(matches == [("sha512", 0x81, len(data), target)])
+
+def test_search_not_found(asa_image):
+    assert(hashsearch.search_hashes(str(asa_image), ["00" * 16], start_range=(0, 0x20)) == [])
+
+def test_search_unknown_digest_length(asa_image):
+    with pytest.raises(ValueError):
+        hashsearch.search_hashes(str(asa_image), ["abcd"])
+    with pytest.raises(ValueError):
+        hashsearch.search_hashes(str(asa_image), ["00" * 16], algorithms=["sha256"])
@@ -0,0 +1,44 @@
+import os
+import pytest
+import asafw.patch as patch
+
+
+def test_patch_kernel_options_resized(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    options = "root=/dev/ram console=ttyS0,9600 " * 4
+    expected = build_image(tmp_path / "expected.bin", rootfs_data, kernel_data, kernel_options=options).read_bytes()
+
+    output = tmp_path / "patched.bin"
+    assert(not patch.patch_image(str(asa_image), str(output), kernel_options=options))
+    assert(output.read_bytes() == expected)
+
+def test_patch_kernel_options_in_place(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    options = "root=/dev/ram quiet loglevel=7 auto kstack=128 reboot=force panic=1 processor.max_cstate=1 useCiscoDma"
+    expected = build_image(tmp_path / "expected.bin", rootfs_data, kernel_data, kernel_options=options).read_bytes()
+    inode = os.stat(asa_image).st_ino
+
+    assert(patch.patch_image(str(asa_image), kernel_options=options))
+    assert(asa_image.read_bytes() == expected)
+    assert(os.stat(asa_image).st_ino == inode)
+
+def test_patch_rootfs(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    new_rootfs = os.urandom(0x2345)
+    expected = build_image(tmp_path / "expected.bin", new_rootfs, kernel_data).read_bytes()
+    (tmp_path / "rootfs.bin").write_bytes(new_rootfs)
+
+    with open(tmp_path / "rootfs.bin", "rb") as rootfs_file:
+        patch.patch_image(str(asa_image), kernel_options=None, rootfs_file=rootfs_file)
+    assert(asa_image.read_bytes() == expected)
+
+def test_patch_both(asa_image, tmp_path, rootfs_data, kernel_data, build_image):
+    new_rootfs = os.urandom(0x100)
+    options = "quiet"
+    expected = build_image(tmp_path / "expected.bin", new_rootfs, kernel_data, kernel_options=options).read_bytes()
+    (tmp_path / "rootfs.bin").write_bytes(new_rootfs)
+
+    with open(tmp_path / "rootfs.bin", "rb") as rootfs_file:
+        patch.patch_image(str(asa_image), str(tmp_path / "out.bin"), options, rootfs_file)
+    assert((tmp_path / "out.bin").read_bytes() == expected)
+
+def test_patch_meta_data_too_long(asa_image):
+    with pytest.raises(ValueError):
+        patch.patch_image(str(asa_image), kernel_options="x" * 0x1000)
@@ -0,0 +1,33 @@
+import os
+import io
+import gzip
+import pytest
+import asafw.asafw as asafw
+import asafw.pgzip as pgzip
+
+
+@pytest.fixture
+def payload():
+    return (b'\x7fELF' + os.urandom(0x4000)) * 20 + b'kernel' * 0x8000
+
+def test_parallel_gzip_round_trip(payload):
+    data = pgzip.compress(payload, jobs=4, chunk_size=0x4000)
+    assert(data[:2] == b'\x1f\x8b')
+    assert(gzip.decompress(data) == payload)
+
+def test_parallel_gzip_reproducible(payload):
+    expected = pgzip.compress(payload, compresslevel=6, jobs=1, chunk_size=0x4000)
+    for jobs in (2, 3, 8):
+        assert(pgzip.compress(payload, compresslevel=6, jobs=jobs, chunk_size=0x4000) == expected)
+    assert(pgzip.compress(payload, compresslevel=6, jobs=2, chunk_size=0x8000) != expected)
+
+def test_parallel_gzip_empty():
+    assert(gzip.decompress(pgzip.compress(b'', jobs=2)) == b'')
+
+def test_create_boot_block_parallel(payload):
+    output_block = io.BytesIO()
+    asafw.create_boot_block(output_block, io.BytesIO(payload), compress_level=1, compress_jobs=2)
+    boot_bin = io.BytesIO(gzip.decompress(output_block.getvalue()))
+    header, _ = asafw.parse_block(boot_bin)
+    assert(header.UUID == asafw.UUID_BOOT_FW_ELF_BLOCK)
+    assert(boot_bin.read(len(payload)) == payload)
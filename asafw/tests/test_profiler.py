@@ -0,0 +1,51 @@
+import io
+import json
+import asafw.asafw as asafw
+import asafw.profiler as profiler
+
+
+def test_profiler_off():
+    assert(profiler.phase("copy") is profiler.NULL_PHASE)
+
+def test_profile_extract(asa_image, tmp_path):
+    with profiler.profiling() as session, open(asa_image, "rb") as bin_file:
+        asafw.check_for_asa_fw_blob(bin_file)
+        asafw.get_blocks_from_file(bin_file, str(tmp_path), True)
+    assert(profiler.phase("copy") is profiler.NULL_PHASE)
+
+    rows = {(row["phase"], row["uuid"]): row for row in session.summary()}
+    assert(rows[("parse_header", str(asafw.UUID_MAIN_CONTAINER))]["calls"] == 1)
+    assert(rows[("inflate", str(asafw.UUID_BOOT_FW_BLOCK))]["bytes"] > 0)
+    with open(asa_image, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        rootfs_length = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0].header.DataLength
+    assert(rows[("read", str(asafw.UUID_ROOTFS_FW_BLOCK))]["bytes"] == rootfs_length)
+
+    trace = json.loads(json.dumps(session.get_chrome_trace()))
+    assert(all(event["ph"] == "X" and event["dur"] >= 0 for event in trace["traceEvents"]))
+    output = io.StringIO()
+    session.write_summary(output)
+    assert(output.getvalue().startswith("phase"))
+
+def test_profile_extract_jobs(asa_image, tmp_path):
+    with profiler.profiling() as session:
+        asafw.get_blocks_from_file_parallel(str(asa_image), str(tmp_path), 2)
+    rows = {(row["phase"], row["uuid"]): row for row in session.summary()}
+    with open(asa_image, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        rootfs_length = index.find(asafw.UUID_ROOTFS_FW_BLOCK)[0].header.DataLength
+    # Recorded in the worker processes and merged on the parent's clock
+    assert(rows[("read", str(asafw.UUID_ROOTFS_FW_BLOCK))]["bytes"] == rootfs_length)
+    assert(rows[("inflate", str(asafw.UUID_BOOT_FW_BLOCK))]["bytes"] > 0)
+    assert(all(event.start >= 0 for event in session.events))
+
+def test_profile_nested_self_time(kernel_data):
+    with profiler.profiling() as session:
+        asafw.gen_blocks(rootfs_block=io.BytesIO(b'rootfs'), kernel_block=io.BytesIO(kernel_data))
+
+    # Deflate runs inside the copy of the kernel block, and is attributed to it
+    events = [event for event in session.events if event.name == "deflate" and event.block_uuid is not None]
+    assert(events)
+    assert(all(event.block_uuid == str(asafw.UUID_BOOT_FW_ELF_BLOCK) for event in events))
+    copy = [event for event in session.events if event.name == "copy" and event.block_uuid == str(asafw.UUID_BOOT_FW_ELF_BLOCK)][0]
+    nested = [event for event in events if copy.start <= event.start < copy.start + copy.duration]
+    assert(nested)
+    assert(copy.self_time == copy.duration - sum(event.duration for event in nested))
@@ -0,0 +1,74 @@
+import io
+import os
+import gzip
+import stat
+import pytest
+import asafw.asafw as asafw
+import asafw.rootfs as rootfs
+
+
+def build_newc(members):
+    archive = bytearray()
+    for inode, (name, mode, data) in enumerate(members + [(rootfs.CPIO_TRAILER, 0, b'')], 1):
+        encoded = name.encode() + b'\x00'
+        fields = (inode, mode, 0, 0, 1, 0, len(data), 0, 0, 0, 0, len(encoded), 0)
+        archive += b'070701' + b''.join(b'%08X' % field for field in fields) + encoded
+        archive += bytes(rootfs.get_padding(len(archive)))
+        archive += data
+        archive += bytes(rootfs.get_padding(len(archive)))
+    return bytes(archive)
+
+@pytest.fixture
+def shell_data():
+    return os.urandom(0x30000)
+
+@pytest.fixture
+def rootfs_image(tmp_path, kernel_data, shell_data):
+    archive = build_newc([
+        (".", stat.S_IFDIR | 0o755, b''),
+        ("bin", stat.S_IFDIR | 0o755, b''),
+        ("bin/sh", stat.S_IFREG | 0o755, shell_data),
+        ("bin/ash", stat.S_IFLNK | 0o777, b'sh'),
+        ("etc/passwd", stat.S_IFREG | 0o644, b'root:x:0:0::/root:/bin/sh\n'),
+        ("escape", stat.S_IFLNK | 0o777, b'/tmp'),
+        ("escape/owned", stat.S_IFREG | 0o644, b'owned'),
+    ])
+    # A second archive after NUL padding, as initramfs images are often concatenated
+    archive += bytes(0x200) + build_newc([("etc/motd", stat.S_IFREG | 0o644, b'hello\n')])
+    image_path = tmp_path / "rootfs.bin"
+    with open(image_path, "wb") as bin_file:
+        asafw.write_asa(bin_file, asafw.gen_blocks(
+            rootfs_block=io.BytesIO(gzip.compress(archive, mtime=0)),
+            kernel_block=io.BytesIO(kernel_data)
+        ))
+    return str(image_path)
+
+def test_ls_rootfs(rootfs_image):
+    listing = [(entry.name, entry.size, target) for entry, target in rootfs.list_rootfs(rootfs_image)]
+    assert(listing == [
+        (".", 0, None), ("bin", 0, None), ("bin/sh", 0x30000, None), ("bin/ash", 2, "sh"),
+        ("etc/passwd", 26, None), ("escape", 4, "/tmp"), ("escape/owned", 5, None), ("etc/motd", 6, None),
+    ])
+    assert([entry.name for entry, _ in rootfs.list_rootfs(rootfs_image, ["etc/*"])] == ["etc/passwd", "etc/motd"])
+
+def test_cat_rootfs(rootfs_image, shell_data):
+    output = io.BytesIO()
+    assert(rootfs.cat_rootfs(rootfs_image, ["/bin/s?"], output) == ["bin/sh"])
+    assert(output.getvalue() == shell_data)
+
+    output = io.BytesIO()
+    assert(rootfs.cat_rootfs(rootfs_image, ["etc/motd"], output) == ["etc/motd"])
+    assert(output.getvalue() == b'hello\n')
+
+def test_extract_rootfs(rootfs_image, tmp_path, shell_data):
+    output_dir = tmp_path / "out"
+    extracted = rootfs.extract_rootfs(rootfs_image, ["bin*", "escape*"], str(output_dir))
+    assert(extracted == ["bin", "bin/sh", "bin/ash", "escape"])
+    assert((output_dir / "bin" / "sh").read_bytes() == shell_data)
+    assert(os.readlink(output_dir / "bin" / "ash") == "sh")
+    assert(stat.S_IMODE(os.stat(output_dir / "bin" / "sh").st_mode) == 0o755)
+
+def test_rootfs_bad_archive(asa_image):
+    # The default test rootfs is random data, not a cpio archive
+    with pytest.raises(ValueError):
+        list(rootfs.list_rootfs(str(asa_image)))
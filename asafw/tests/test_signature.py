@@ -0,0 +1,65 @@
+import os
+import pytest
+from Crypto.Hash import SHA512
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+import asafw.asafw as asafw
+import asafw.signature as signature
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return RSA.generate(2048)
+
+
+def sign_image(image_path, private_key):
+    image = bytearray(image_path.read_bytes())
+    with open(image_path, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        old_signature = signature.get_magic_key(index)
+        data_range = index.root.data_range
+    new_signature = pkcs1_15.new(private_key).sign(SHA512.new(image[data_range[0]:data_range[1]]))
+    offset = image.find(old_signature)
+    image[offset:offset + len(new_signature)] = new_signature
+    image_path.write_bytes(image)
+
+def test_verify_signature(asa_image, private_key):
+    public_key = private_key.publickey()
+    assert(not signature.verify_signature(str(asa_image), public_key)["valid"])
+    sign_image(asa_image, private_key)
+    result = signature.verify_signature(str(asa_image), public_key)
+    assert(result["valid"])
+    assert(result["offset"] + result["length"] <= os.path.getsize(asa_image))
+
+def test_verify_signature_tampered(asa_image, private_key):
+    sign_image(asa_image, private_key)
+    image = bytearray(asa_image.read_bytes())
+    image[-0x10] ^= 0xff
+    asa_image.write_bytes(image)
+    assert(not signature.verify_signature(str(asa_image), private_key.publickey())["valid"])
+
+def test_get_public_key():
+    key = signature.get_public_key("01:00:\n01", 3)
+    assert(key.n == 0x10001 and key.e == 3)
+
+def test_signature_cache(asa_image, private_key, tmp_path):
+    sign_image(asa_image, private_key)
+    public_key = private_key.publickey()
+    cache_path = str(tmp_path / "cache" / "signatures.json")
+
+    results = list(signature.verify_signatures([str(asa_image)], public_key, cache=signature.SignatureCache(cache_path)))
+    assert(results[0]["valid"] and not results[0]["cached"])
+    results = list(signature.verify_signatures([str(asa_image)], public_key, cache=signature.SignatureCache(cache_path)))
+    assert(results[0]["valid"] and results[0]["cached"])
+
+    # A rewritten file is hashed again, even when its size is unchanged
+    image = bytearray(asa_image.read_bytes())
+    image[-0x10] ^= 0xff
+    asa_image.write_bytes(image)
+    stat = os.stat(asa_image)
+    os.utime(asa_image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    results = list(signature.verify_signatures([str(asa_image)], public_key, cache=signature.SignatureCache(cache_path)))
+    assert(not results[0]["valid"] and not results[0]["cached"])
+
+    other_key = signature.get_public_key(RSA.generate(1024).n)
+    results = list(signature.verify_signatures([str(asa_image)], other_key, cache=signature.SignatureCache(cache_path)))
+    assert(not results[0]["cached"])
@@ -0,0 +1,64 @@
+import os
+import asafw.asafw as asafw
+import asafw.verify as verify
+
+
+def get_entry(image_path, block_uuid):
+    with open(image_path, "rb") as bin_file, asafw.AsaBlockIndex(bin_file) as index:
+        entry = index.find(block_uuid)[0]
+        return entry.header_offset, entry.meta_range, entry.data_range
+
+def corrupt(image_path, offset, data):
+    image = bytearray(image_path.read_bytes())
+    image[offset:offset + len(data)] = data
+    image_path.write_bytes(image)
+
+def test_verify_ok(asa_image):
+    report = verify.verify_image(str(asa_image))
+    assert(report.ok(strict=True))
+    assert(report.blocks == 5)
+
+def test_verify_truncated(asa_image):
+    asa_image.write_bytes(asa_image.read_bytes()[:-0x20])
+    report = verify.verify_image(str(asa_image))
+    assert(not report.ok())
+    assert("past the end of the file" in report.errors[0])
+
+def test_verify_field1(asa_image):
+    _, meta_range, _ = get_entry(asa_image, asafw.UUID_MAIN_CONTAINER)
+    # Field 2 claims far more data than the metadata holds
+    corrupt(asa_image, meta_range[0] + 5 + 1, b'\x0f\xff')
+    report = verify.verify_image(str(asa_image))
+    assert(len(report.errors) == 1)
+    assert("field1 2" in report.errors[0])
+
+def test_verify_padding(asa_image):
+    _, meta_range, _ = get_entry(asa_image, asafw.UUID_KERNEL_PARAMS)
+    corrupt(asa_image, meta_range[1] - 1, b'\x01')
+    _, meta_range, _ = get_entry(asa_image, asafw.UUID_MAIN_CONTAINER)
+    corrupt(asa_image, meta_range[1] - 1, b'\x01')
+    report = verify.verify_image(str(asa_image))
+    assert(len(report.errors) == 2)
+    assert(all("padding" in error for error in report.errors))
+
+def test_verify_container_overrun(asa_image):
+    header_offset, _, _ = get_entry(asa_image, asafw.UUID_KERNEL_PARAMS)
+    header = asafw.AsaBlockHeader.unpack_from(asa_image.read_bytes(), header_offset)
+    header.DataLength = 0x100000
+    header.MetaDataLength = 0
+    corrupt(asa_image, header_offset, header.pack())
+    report = verify.verify_image(str(asa_image))
+    assert(not report.ok())
+    assert(any("container" in error or "end of the file" in error for error in report.errors))
+
+def test_verify_unknown_uuid_and_directory(asa_image, tmp_path):
+    header_offset, _, _ = get_entry(asa_image, asafw.UUID_ROOTFS_FW_BLOCK)
+    other = tmp_path / "other.bin"
+    other.write_bytes(asa_image.read_bytes())
+    corrupt(other, header_offset, os.urandom(0x10))
+    (tmp_path / "empty.bin").write_bytes(b'')
+
+    reports = {os.path.basename(report.path): report for report in verify.verify_images([str(tmp_path)], jobs=2)}
+    assert(reports["asa.bin"].ok(strict=True))
+    assert(reports["other.bin"].ok() and not reports["other.bin"].ok(strict=True))
+    assert(not reports["empty.bin"].ok())
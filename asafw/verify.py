@@ -0,0 +1,176 @@
+import concurrent.futures
+import mmap
+import uuid
+import asafw.asafw as asafw
+
+KNOWN_UUIDS = {
+    value for name, value in vars(asafw).items()
+    if name.startswith("UUID_") and isinstance(value, uuid.UUID) and value != asafw.UUID_ASA_FW_BLOB
+}
+
+FIELD1_HEADER_SIZE = 3
+FIELD1_TERMINATOR = 0xeb
+FIELD1_CONTAINER = 3
+FIELD1_NESTED = (4, 5, 6)
+FIELD1_LAST = 12
+
+
+class VerifyReport():
+    def __init__(self, path):
+        self.path = path
+        self.errors = []
+        self.warnings = []
+        self.blocks = 0
+
+    def error(self, offset, message):
+        self.errors.append(f"{hex(offset)}: {message}")
+
+    def warning(self, offset, message):
+        self.warnings.append(f"{hex(offset)}: {message}")
+
+    def ok(self, strict=False):
+        return not self.errors and not (strict and self.warnings)
+
+    def to_dict(self, strict=False):
+        return {
+            "path": self.path,
+            "ok": self.ok(strict),
+            "blocks": self.blocks,
+            "errors": self.errors,
+            "warnings": self.warnings,
+        }
+
+
+def is_zero(view, start, end):
+    return end <= start or not bytes(view[start:end]).strip(b'\x00')
+
+
+def check_field1(view, start, end, report):
+    # Top level TLVs 1 to 12 with 4 to 6 nested in 3, then the terminator and zero padding
+    offset = start
+    last_field = 0
+    while True:
+        if offset >= end:
+            report.error(offset, "field1 metadata has no terminator")
+            return
+        if view[offset] == FIELD1_TERMINATOR:
+            break
+        if offset + FIELD1_HEADER_SIZE > end:
+            report.error(offset, "field1 header truncated")
+            return
+        field = view[offset]
+        length = int.from_bytes(view[offset + 1:offset + 3], "big")
+        data_start = offset + FIELD1_HEADER_SIZE
+        if data_start + length > end:
+            report.error(offset, f"field1 {field} length {hex(length)} runs past the metadata")
+            return
+        if not last_field < field <= FIELD1_LAST or field in FIELD1_NESTED:
+            report.error(offset, f"unexpected field1 {field} after field {last_field}")
+            return
+        if field == FIELD1_CONTAINER:
+            nested = data_start
+            for nested_field in FIELD1_NESTED:
+                if nested + FIELD1_HEADER_SIZE > data_start + length or view[nested] != nested_field:
+                    report.error(nested, f"field1 {field} is missing nested field {nested_field}")
+                    return
+                nested += FIELD1_HEADER_SIZE + int.from_bytes(view[nested + 1:nested + 3], "big")
+            if nested != data_start + length:
+                report.error(data_start, f"field1 {field} nested fields do not add up to {hex(length)}")
+                return
+        last_field = field
+        offset = data_start + length
+
+    if last_field != FIELD1_LAST:
+        report.error(offset, f"field1 ends after field {last_field}")
+    if not is_zero(view, offset + 1, end):
+        report.error(offset + 1, "non-zero padding after the field1 terminator")
+
+
+def check_kernel_params(view, start, end, report):
+    options = bytes(view[start:end])
+    terminator = options.find(b'\x00')
+    if terminator >= 0 and options[terminator:].strip(b'\x00'):
+        report.error(start + terminator, "non-zero padding after the kernel options")
+
+
+def check_block(view, offset, header, limit, report):
+    meta_start = offset + asafw.AsaBlockHeader.size
+    data_start = meta_start + header.MetaDataLength
+    data_end = data_start + header.DataLength
+
+    if offset % 0x10:
+        report.error(offset, f"block {header.UUID} is not 16-byte aligned")
+    if header.data_length & 0xf or asafw.get_boundary_aligned_length(header.DataLength) != header.DataLength:
+        report.error(offset, f"block {header.UUID} data length {hex(header.DataLength)} is not 16-byte aligned")
+    if header.UUID not in KNOWN_UUIDS:
+        report.warning(offset, f"unknown block UUID {header.UUID}")
+    if data_end > len(view):
+        report.error(offset, f"block {header.UUID} ends at {hex(data_end)}, past the end of the file at {hex(len(view))}")
+        return None
+    if data_end > limit:
+        report.error(offset, f"block {header.UUID} ends at {hex(data_end)}, past the end of its container at {hex(limit)}")
+        return None
+
+    if header.UUID == asafw.UUID_MAIN_CONTAINER and header.MetaDataLength > 0:
+        check_field1(view, meta_start, data_start, report)
+    elif header.UUID == asafw.UUID_KERNEL_PARAMS:
+        check_kernel_params(view, meta_start, data_start, report)
+    return data_end
+
+
+def verify_view(view, report):
+    offset = 0
+    if bytes(view[0:0x10]) == asafw.UUID_ASA_FW_BLOB.bytes:
+        offset = 0x10
+    else:
+        report.warning(0, "no UUID_ASA_FW_BLOB prefix")
+
+    # Same pre-order walk as walk_block_headers, but it reports problems instead of stopping at the first
+    stack = []
+    while True:
+        limit = stack[-1] if stack else len(view)
+        if offset + asafw.AsaBlockHeader.size > limit:
+            report.error(offset, "truncated block header")
+            return
+        header = asafw.AsaBlockHeader.unpack_from(view, offset)
+        report.blocks += 1
+        data_end = check_block(view, offset, header, limit, report)
+        if data_end is None:
+            return
+
+        data_start = data_end - header.DataLength
+        if header.HasSubBlocks and data_end > data_start:
+            stack.append(data_end)
+            offset = data_start
+        else:
+            offset = data_end
+        while stack and offset >= stack[-1]:
+            stack.pop()
+        if not stack:
+            break
+
+    if not is_zero(view, offset, len(view)):
+        report.error(offset, f"{hex(len(view) - offset)} bytes of data after the last block")
+    elif offset < len(view):
+        report.warning(offset, f"{hex(len(view) - offset)} bytes of zero padding after the last block")
+
+
+def verify_image(file_name):
+    report = VerifyReport(file_name)
+    try:
+        with open(file_name, "rb") as bin_file, \
+                mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_map:
+            view = memoryview(raw_map)
+            try:
+                verify_view(view, report)
+            finally:
+                view.release()
+    except (OSError, ValueError) as e:
+        report.error(0, str(e))
+    return report
+
+
+def verify_images(paths, jobs=8):
+    # Only headers and short padding ranges are touched, so threads keep many files in flight
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(verify_image, asafw.iter_image_files(paths))